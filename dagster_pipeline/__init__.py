@@ -1,12 +1,13 @@
-from dagster import Definitions, ScheduleDefinition
+from dagster import Definitions, build_schedule_from_partitioned_job
 from .jobs.telegram_pipeline import telegram_job
 from .resources import postgres_resource, telegram_resource
 
-# Define a daily schedule for the pipeline
-daily_telegram_schedule = ScheduleDefinition(
+# Define a daily schedule for the pipeline; each tick at midnight UTC
+# runs the partition for the day that just ended
+daily_telegram_schedule = build_schedule_from_partitioned_job(
     job=telegram_job,
-    cron_schedule="0 0 * * *",  # Run daily at midnight UTC
-    execution_timezone="UTC"
+    hour_of_day=0,
+    minute_of_hour=0
 )
 
 defs = Definitions(
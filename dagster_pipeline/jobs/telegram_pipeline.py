@@ -1,74 +1,94 @@
-from dagster import job, op, get_dagster_logger, graph
+from dagster import job, op, get_dagster_logger, graph, DailyPartitionsDefinition, In, Out, Nothing
 from pathlib import Path
-import subprocess
+import asyncio
+import sys
 import os
-from datetime import datetime
-from typing import Dict, Any
+from collections import deque
 
 # Import resources
 from ..resources import postgres_resource, telegram_resource
 
-@op(required_resource_keys={"telegram"})
-def scrape_telegram_data(context):
+# The scripts import each other as top-level modules (config, services, ...),
+# so their directory has to be importable for the ops to call them in-process.
+SCRIPTS_DIR = Path(__file__).parent.parent.parent / "scripts"
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.append(str(SCRIPTS_DIR))
+
+# One partition per day: a run scrapes the messages sent that day (UTC) into
+# that day's directory and replaces that day's rows in the raw tables
+daily_partitions = DailyPartitionsDefinition(start_date="2024-01-01")
+
+
+def partition_day(context):
+    """Return the run's partition key (YYYY-MM-DD), or None for unpartitioned runs."""
+    return context.partition_key if context.has_partition_key else None
+
+@op(required_resource_keys={"telegram"}, out=Out(Nothing))
+async def scrape_telegram_data(context):
     """Scrape data from Telegram channels."""
     logger = get_dagster_logger()
     logger.info("Starting Telegram data scraping...")
     
-    # Run your scraping script
-    script_path = Path(__file__).parent.parent.parent / "scripts" / "scraping.py"
-    if not script_path.exists():
-        raise FileNotFoundError(f"Scraping script not found at {script_path}")
+    # The scraper reads its credentials from the environment; use the ones
+    # configured on the resource, even if config was imported by an earlier run
+    telegram = context.resources.telegram
+    os.environ.update({
+        name: value
+        for name, value in (
+            ("TELEGRAM_APP_ID", telegram.api_id),
+            ("TELEGRAM_API_HASH", telegram.api_hash),
+            ("TELEGRAM_PHONE", telegram.phone),
+        )
+        if value
+    })
     
-    result = subprocess.run(
-        ["python", str(script_path)], 
-        capture_output=True, 
-        text=True,
-        env=dict(os.environ, **{
-            "TELEGRAM_APP_ID": context.resources.telegram["api_id"],
-            "TELEGRAM_API_HASH": context.resources.telegram["api_hash"],
-            "TELEGRAM_PHONE": context.resources.telegram["phone"]
-        })
-    )
+    # Imported lazily so Telethon is only loaded when this op runs
+    from config.config import config
+    from scraping import main as scrape_channels
+    config.load_telegram_credentials()
     
-    if result.returncode != 0:
-        logger.error(f"Scraping failed: {result.stderr}")
-        raise Exception(f"Scraping failed: {result.stderr}")
+    await scrape_channels(day=partition_day(context))
     
     logger.info("Successfully scraped Telegram data")
-    return {"status": "success", "timestamp": datetime.utcnow().isoformat()}
 
-@op(required_resource_keys={"postgres"})
-def load_raw_to_postgres(context, previous_result):
+@op(required_resource_keys={"postgres"}, ins={"start": In(Nothing)}, out=Out(Nothing))
+def load_raw_to_postgres(context):
     """Load raw data into PostgreSQL."""
     logger = get_dagster_logger()
     logger.info("Loading raw data to PostgreSQL...")
     
-    script_path = Path(__file__).parent.parent.parent / "scripts" / "load_to_postgres.py"
-    if not script_path.exists():
-        raise FileNotFoundError(f"Load script not found at {script_path}")
+    from load_to_postgres import load_json_files
     
-    result = subprocess.run(
-        ["python", str(script_path)], 
-        capture_output=True, 
-        text=True,
-        env=dict(os.environ, **{
-            "POSTGRES_HOST": context.resources.postgres["db_host"],
-            "POSTGRES_PORT": context.resources.postgres["db_port"],
-            "POSTGRES_DB": context.resources.postgres["db_name"],
-            "POSTGRES_USER": context.resources.postgres["db_user"],
-            "POSTGRES_PASSWORD": context.resources.postgres["db_password"]
-        })
+    rows = load_json_files(
+        context.resources.postgres.get_pool(),
+        "data/raw",
+        max_workers=context.resources.postgres.max_connections,
+        day=partition_day(context)
     )
     
-    if result.returncode != 0:
-        logger.error(f"Loading to PostgreSQL failed: {result.stderr}")
-        raise Exception(f"Loading to PostgreSQL failed: {result.stderr}")
-    
+    logger.info(f"Loaded {rows} rows")
     logger.info("Successfully loaded data to PostgreSQL")
-    return {"status": "success", "timestamp": datetime.utcnow().isoformat()}
 
-@op(required_resource_keys={"postgres"})
-def run_dbt_transformations(context, previous_result):
+async def stream_subprocess(cmd, logger, **kwargs):
+    """
+    Run a command without blocking the event loop, logging its output line by line.
+    Returns the exit code and the last lines of output for error reporting.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        **kwargs
+    )
+    tail = deque(maxlen=50)
+    async for line in proc.stdout:
+        text = line.decode(errors="replace").rstrip()
+        tail.append(text)
+        logger.info(text)
+    return await proc.wait(), "\n".join(tail)
+
+@op(required_resource_keys={"postgres"}, ins={"start": In(Nothing)}, out=Out(Nothing))
+async def run_dbt_transformations(context):
     """Run dbt transformations."""
     logger = get_dagster_logger()
     logger.info("Running dbt transformations...")
@@ -79,71 +99,53 @@ def run_dbt_transformations(context, previous_result):
         raise FileNotFoundError(f"dbt project not found at {dbt_project}")
     
     env = dict(os.environ, **{
-        "DBT_HOST": context.resources.postgres["db_host"],
-        "DBT_PORT": context.resources.postgres["db_port"],
-        "DBT_DATABASE": context.resources.postgres["db_name"],
-        "DBT_USER": context.resources.postgres["db_user"],
-        "DBT_PASSWORD": context.resources.postgres["db_password"]
+        "DBT_HOST": context.resources.postgres.db_host,
+        "DBT_PORT": context.resources.postgres.db_port,
+        "DBT_DATABASE": context.resources.postgres.db_name,
+        "DBT_USER": context.resources.postgres.db_user,
+        "DBT_PASSWORD": context.resources.postgres.db_password
     })
     
-    result = subprocess.run(
+    returncode, output = await stream_subprocess(
         ["dbt", "run", "--profiles-dir", str(dbt_project)], 
+        logger,
         cwd=str(dbt_project),
-        capture_output=True, 
-        text=True,
         env=env
     )
     
-    if result.returncode != 0:
-        logger.error(f"dbt transformations failed: {result.stderr}")
-        raise Exception(f"dbt transformations failed: {result.stderr}")
+    if returncode != 0:
+        logger.error(f"dbt transformations failed: {output}")
+        raise Exception(f"dbt transformations failed: {output}")
     
     logger.info("Successfully ran dbt transformations")
-    return {"status": "success", "timestamp": datetime.utcnow().isoformat()}
 
-@op(required_resource_keys={"postgres"})
-def run_yolo_enrichment(context, previous_result):
+@op(required_resource_keys={"postgres"}, ins={"start": In(Nothing)}, out=Out(Nothing))
+def run_yolo_enrichment(context):
     """Run YOLO object detection on images."""
     logger = get_dagster_logger()
     logger.info("Running YOLO enrichment...")
     
-    script_path = Path(__file__).parent.parent.parent / "scripts" / "detect_objects.py"
-    if not script_path.exists():
-        logger.warning(f"YOLO script not found at {script_path}, skipping...")
-        return {"status": "skipped", "reason": "YOLO script not found", "timestamp": datetime.utcnow().isoformat()}
-    
-    result = subprocess.run(
-        ["python", str(script_path)], 
-        capture_output=True, 
-        text=True,
-        env=dict(os.environ, **{
-            "POSTGRES_HOST": context.resources.postgres["db_host"],
-            "POSTGRES_PORT": context.resources.postgres["db_port"],
-            "POSTGRES_DB": context.resources.postgres["db_name"],
-            "POSTGRES_USER": context.resources.postgres["db_user"],
-            "POSTGRES_PASSWORD": context.resources.postgres["db_password"]
-        })
-    )
-    
-    if result.returncode != 0:
-        logger.error(f"YOLO enrichment failed: {result.stderr}")
-        raise Exception(f"YOLO enrichment failed: {result.stderr}")
+    # Imported lazily so ultralytics is only loaded when this op runs; a
+    # missing install fails the op
+    from detect_objects import main as detect_objects
     
+    detections = detect_objects()
+    logger.info(f"Saved {detections} detections")
     logger.info("Successfully ran YOLO enrichment")
-    return {"status": "success", "timestamp": datetime.utcnow().isoformat()}
 
 @graph
 def telegram_pipeline():
     """Main pipeline for Telegram data processing."""
-    # Define the execution order
+    # Define the execution order; ops only pass ordering, not data
     scraped = scrape_telegram_data()
-    loaded = load_raw_to_postgres(scraped)
-    transformed = run_dbt_transformations(loaded)
-    run_yolo_enrichment(transformed)
+    loaded = load_raw_to_postgres(start=scraped)
+    transformed = run_dbt_transformations(start=loaded)
+    run_yolo_enrichment(start=transformed)
 
 # Create a job from the graph
 telegram_job = telegram_pipeline.to_job(
     name="telegram_pipeline_job",
+    partitions_def=daily_partitions,
     resource_defs={
         "postgres": postgres_resource,
         "telegram": telegram_resource
@@ -1,30 +1,58 @@
-from dagster import resource
+from dagster import ConfigurableResource
+from psycopg2.pool import ThreadedConnectionPool
+from pydantic import PrivateAttr
+from typing import Optional
 import os
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-@resource
-class PostgresResource:
-    def __init__(self, init_context):
-        self.config = {
-            "db_host": os.getenv("POSTGRES_HOST", "localhost"),
-            "db_port": os.getenv("POSTGRES_PORT", "5432"),
-            "db_name": os.getenv("POSTGRES_DB", "telegram"),
-            "db_user": os.getenv("POSTGRES_USER", "postgres"),
-            "db_password": os.getenv("POSTGRES_PASSWORD", "postgres"),
-        }
+class PostgresResource(ConfigurableResource):
+    db_host: str = "localhost"
+    db_port: str = "5432"
+    db_name: str = "telegram"
+    db_user: str = "postgres"
+    db_password: str = "postgres"
+    max_connections: int = 10
 
-@resource
-class TelegramResource:
-    def __init__(self, init_context):
-        self.config = {
-            "api_id": os.getenv("TELEGRAM_APP_ID"),
-            "api_hash": os.getenv("TELEGRAM_API_HASH"),
-            "phone": os.getenv("TELEGRAM_PHONE"),
-        }
+    # Created on first use and shared by everything in the op's process
+    _pool: Optional[ThreadedConnectionPool] = PrivateAttr(default=None)
+
+    def get_pool(self) -> ThreadedConnectionPool:
+        """Return the shared connection pool, creating it on first use."""
+        if self._pool is None:
+            self._pool = ThreadedConnectionPool(
+                1,
+                self.max_connections,
+                host=self.db_host,
+                port=self.db_port,
+                dbname=self.db_name,
+                user=self.db_user,
+                password=self.db_password
+            )
+        return self._pool
+
+    def teardown_after_execution(self, context) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+class TelegramResource(ConfigurableResource):
+    api_id: Optional[str] = None
+    api_hash: Optional[str] = None
+    phone: Optional[str] = None
 
 # Resource instances for Dagster
-postgres_resource = PostgresResource(None)
-telegram_resource = TelegramResource(None)
\ No newline at end of file
+postgres_resource = PostgresResource(
+    db_host=os.getenv("POSTGRES_HOST", "localhost"),
+    db_port=os.getenv("POSTGRES_PORT", "5432"),
+    db_name=os.getenv("POSTGRES_DB", "telegram"),
+    db_user=os.getenv("POSTGRES_USER", "postgres"),
+    db_password=os.getenv("POSTGRES_PASSWORD", "postgres"),
+)
+telegram_resource = TelegramResource(
+    api_id=os.getenv("TELEGRAM_APP_ID"),
+    api_hash=os.getenv("TELEGRAM_API_HASH"),
+    phone=os.getenv("TELEGRAM_PHONE"),
+)
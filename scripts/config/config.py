@@ -1,8 +1,10 @@
 import os
 import logging
+from functools import cache
 from pathlib import Path
+from types import MappingProxyType
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Mapping
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -16,9 +18,7 @@ class Config:
         load_dotenv(dotenv_path=env_path)
         
         # Telegram API credentials
-        self.API_ID = os.getenv('TELEGRAM_APP_ID')
-        self.API_HASH = os.getenv('TELEGRAM_API_HASH')
-        self.PHONE = os.getenv('TELEGRAM_PHONE')
+        self.load_telegram_credentials()
         
         # Scraper settings
         self.BASE_DIR = Path(__file__).parent.parent.parent
@@ -28,10 +28,41 @@ class Config:
         self.MESSAGES_DIR = self.RAW_DATA_DIR / 'telegram_messages'
         self.MEDIA_DIR = self.RAW_DATA_DIR / 'telegram_media'
         
+        # Number of channels scraped at the same time
+        self.MAX_CONCURRENT_CHANNELS = int(os.getenv('MAX_CONCURRENT_CHANNELS', '3'))
+        
+        # Media downloads in flight at once for each channel
+        self.MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '8'))
+        
+        # Telegram requests (entity lookups, downloads) started per second
+        self.TELEGRAM_REQUESTS_PER_SECOND = float(os.getenv('TELEGRAM_REQUESTS_PER_SECOND', '30'))
+        
+        # A channel-day scraped less than this many seconds ago is not re-scraped
+        self.SCRAPE_TTL = int(os.getenv('SCRAPE_TTL', '3600'))
+        
+        # Minimum seconds between progress log lines in per-message loops
+        self.PROGRESS_LOG_INTERVAL = float(os.getenv('PROGRESS_LOG_INTERVAL', '1.0'))
+        
+        # Message fields kept when saving scraped messages (comma-separated);
+        # 'id' is always kept, since resuming and incremental scrapes rely on it
+        self.MESSAGE_FIELDS = tuple(
+            field.strip()
+            for field in os.getenv('MESSAGE_FIELDS', 'id,date,message,views,forwards').split(',')
+            if field.strip()
+        )
+        
         # Create necessary directories
         self._create_directories()
-        
-        # Validate configuration
+    
+    def load_telegram_credentials(self) -> None:
+        """
+        (Re)read the Telegram credentials from the environment and validate
+        them, for callers that set them after this module was imported.
+        """
+        self.API_ID = os.getenv('TELEGRAM_APP_ID')
+        self.API_HASH = os.getenv('TELEGRAM_API_HASH')
+        self.PHONE = os.getenv('TELEGRAM_PHONE')
+        Config.get_telegram_config.cache_clear()
         self._validate()
     
     def _create_directories(self) -> None:
@@ -55,13 +86,14 @@ class Config:
                 "Please set TELEGRAM_APP_ID, TELEGRAM_API_HASH, and TELEGRAM_PHONE in .env file"
             )
     
-    def get_telegram_config(self) -> Dict[str, str]:
-        """Get Telegram API configuration."""
-        return {
+    @cache
+    def get_telegram_config(self) -> Mapping[str, str]:
+        """Get Telegram API configuration (built once, read-only)."""
+        return MappingProxyType({
             'api_id': self.API_ID,
             'api_hash': self.API_HASH,
             'phone': self.PHONE
-        }
+        })
 
 # Create a global config instance
 config = Config()
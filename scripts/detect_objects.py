@@ -2,41 +2,121 @@ import os
 import csv
 from pathlib import Path
 from ultralytics import YOLO
+import numpy as np
 import pandas as pd
 
 # Paths
 IMAGES_DIR = Path("data/raw/telegram_media")
 
-intermediate_dir = Path("data/intermediate")
-intermediate_dir.mkdir(parents=True, exist_ok=True)  # ✅ Creates if missing
+OUTPUT_CSV = Path("data/intermediate/image_detections.csv")
 
+# (file_path, mtime in ns) of every image already run through the detector
+MANIFEST_CSV = Path("data/intermediate/processed_images.csv")
 
-OUTPUT_CSV = Path("data/intermediate/image_detections.csv")
+DETECTION_COLUMNS = ["file_path", "detected_object_class", "confidence_score"]
+
+# Number of images per forward pass
+BATCH_SIZE = 32
+
+# PyTorch weights and the ONNX graph exported from them on first use
+MODEL_WEIGHTS = Path("yolov8n.pt")
+ONNX_WEIGHTS = MODEL_WEIGHTS.with_suffix(".onnx")
+
+
+def load_model():
+    """
+    Load the detector, preferring the exported ONNX graph.
+    The graph is exported once and reused on later runs; if export is not
+    possible (onnx not installed), the PyTorch weights are used instead.
+    """
+    if not ONNX_WEIGHTS.exists():
+        try:
+            YOLO(str(MODEL_WEIGHTS)).export(format="onnx", dynamic=True, simplify=True)
+        except Exception as e:
+            print(f"ONNX export failed ({e}), falling back to {MODEL_WEIGHTS}")
+            return YOLO(str(MODEL_WEIGHTS)), MODEL_WEIGHTS
+    return YOLO(str(ONNX_WEIGHTS), task="detect"), ONNX_WEIGHTS
+
+
+def load_manifest(manifest_csv=MANIFEST_CSV):
+    """Return {file_path: mtime} for images processed by earlier runs."""
+    if not manifest_csv.exists():
+        return {}
+    manifest = pd.read_csv(manifest_csv)
+    return dict(zip(manifest["file_path"], manifest["mtime"]))
+
+
+def replace_rows(df, path, file_paths):
+    """
+    Rewrite a CSV with its rows for file_paths replaced by df. The new file
+    is written next to it and renamed over it, so a crash leaves either the
+    old or the new version.
+    """
+    if path.exists():
+        existing = pd.read_csv(path)
+        df = pd.concat([existing[~existing["file_path"].isin(file_paths)], df], ignore_index=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def main(images_dir=IMAGES_DIR, output_csv=OUTPUT_CSV, manifest_csv=MANIFEST_CSV):
+    """Run YOLO over new or changed images and save their detections to CSV."""
+    output_csv.parent.mkdir(parents=True, exist_ok=True)  # ✅ Creates if missing
+
+    # Find image files not seen (or modified) since the last run
+    processed = load_manifest(manifest_csv)
+    image_paths, relative_paths, mtimes = [], [], []
+    for img_path in images_dir.rglob("*.jpg"):
+        relative_path = str(Path("data/raw/telegram_media") / img_path.relative_to(images_dir))
+        mtime = img_path.stat().st_mtime_ns
+        if processed.get(relative_path) != mtime:
+            image_paths.append(img_path)
+            relative_paths.append(relative_path)
+            mtimes.append(mtime)
+
+    if not image_paths:
+        print(f"No new images in {images_dir}")
+        return 0
 
-# Load YOLOv8 model (use yolov8n.pt or yolov8s.pt for speed)
-model = YOLO("yolov8n.pt")
+    # Load YOLOv8 model (use yolov8n.pt or yolov8s.pt for speed)
+    model, weights = load_model()
 
-# Find image files
-image_paths = list(IMAGES_DIR.rglob("*.jpg"))
+    # Batched, streamed inference keeps memory flat while amortising the
+    # per-call overhead; half precision is only applied to PyTorch weights
+    # on GPU devices (the ONNX graph is exported in FP32).
+    predictions = model(
+        [str(p) for p in image_paths],
+        batch=BATCH_SIZE,
+        stream=True,
+        half=weights.suffix == ".pt",
+        verbose=False,
+    )
 
-results = []
+    # Detections are collected column-wise, one array per image
+    file_paths, cls_ids, confs = [], [], []
+    for relative_path, prediction in zip(relative_paths, predictions):
+        boxes = prediction.boxes
+        cls_ids.append(boxes.cls.cpu().numpy().astype(int))
+        confs.append(boxes.conf.cpu().numpy())
+        file_paths.extend([relative_path] * len(boxes))
 
-for img_path in image_paths:
-    detections = model(img_path)
-    
-    for det in detections[0].boxes:
-        cls_id = int(det.cls[0])
-        conf = float(det.conf[0])
-        cls_name = model.names[cls_id]
+    cls_ids = np.concatenate(cls_ids) if cls_ids else np.empty(0, dtype=int)
+    names = np.array([model.names[i] for i in range(len(model.names))], dtype=object)
+    detections = pd.DataFrame({
+        "file_path": file_paths,
+        "detected_object_class": names[cls_ids],
+        "confidence_score": np.concatenate(confs) if confs else np.empty(0, dtype=np.float32),
+    }, columns=DETECTION_COLUMNS)
 
-        relative_path = str(Path("data/raw/telegram_media") / img_path.relative_to(IMAGES_DIR))
+    # Replace any earlier detections for these images, then record them so
+    # later runs skip them. Both writes replace rather than append, so a
+    # crash in between only means the images are detected again next run.
+    replace_rows(detections, output_csv, relative_paths)
+    replace_rows(pd.DataFrame({"file_path": relative_paths, "mtime": mtimes}), manifest_csv, relative_paths)
+    print(f"Saved {len(detections)} detections from {len(image_paths)} new images to {output_csv}")
+    return len(detections)
 
-        results.append({
-            "file_path": relative_path,
-            "detected_object_class": cls_name,
-            "confidence_score": conf,
-        })
 
-# Save results to CSV
-pd.DataFrame(results).to_csv(OUTPUT_CSV, index=False)
-print(f"Saved {len(results)} detections to {OUTPUT_CSV}")
+if __name__ == "__main__":
+    main()
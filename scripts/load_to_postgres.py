@@ -1,99 +1,221 @@
 # scripts/load_to_postgres.py
 import os
-import json
-import psycopg2
-from psycopg2.extras import execute_values
-from datetime import datetime
-import glob
+import io
+import re
+import logging
+import ijson
+import orjson
+import zstandard as zstd
+from psycopg2.pool import ThreadedConnectionPool
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Tab-delimited CSV with a quote character that never appears in the data, so
+# serialized JSON (which already escapes tabs/newlines) can be streamed as-is.
+COPY_OPTIONS = "FORMAT csv, DELIMITER E'\\t', QUOTE E'\\b'"
+
+# Rows buffered in memory before they are flushed to the server with COPY
+COPY_BATCH_ROWS = 10000
+
+# Bytes sent per CopyData message (psycopg2 defaults to 8 KiB)
+COPY_CHUNK_SIZE = 1 << 20
+
+# Files loaded concurrently, each on its own pooled connection
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "8"))
+
+MESSAGE_COLUMNS = ("channel_username", "message_date", "message_data")
+MEDIA_COLUMNS = ("channel_username", "media_date", "media_data")
+
+# JSON arrays (older scrapes) and NDJSON files, optionally zstd-compressed
+JSON_SUFFIXES = (".json", ".jsonl", ".jsonl.zst")
+
+# Applied in name order; each one can safely be re-run
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+DATE_DIR_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
 def get_channel_name_from_path(file_path):
     """
     Extract channel name from file path.
     Expected path format: .../telegram_messages/YYYY-MM-DD/channel_name/messages_*.json
     """
-    try:
-        # Split the path into parts
-        parts = file_path.split(os.sep)
-        
-        # Find the index of 'telegram_messages' in the path
-        try:
-            base_idx = parts.index('telegram_messages')
-        except ValueError:
-            # If 'telegram_messages' not found, try to find the first date-like part
-            date_pattern = re.compile(r'\d{4}-\d{2}-\d{2}')
-            for i, part in enumerate(parts):
-                if date_pattern.match(part) and i + 1 < len(parts):
-                    return parts[i + 1]
-            return 'unknown'
-        
-        # The channel name should be two directories after 'telegram_messages'
-        if base_idx + 2 < len(parts):
-            return parts[base_idx + 2]
-            
-        return 'unknown'
-    except Exception as e:
-        logger.error(f"Error extracting channel name from {file_path}: {e}")
-        return 'unknown'
-
-
-def load_json_files(conn, base_dir):
-    """Load JSON files from directory into PostgreSQL"""
-    cur = conn.cursor()
+    parts = Path(file_path).parts
     
-    # Create raw schema if not exists
-    cur.execute("""
-    CREATE SCHEMA IF NOT EXISTS raw;
+    # The channel name should be two directories after 'telegram_messages'
+    if 'telegram_messages' in parts:
+        channel_idx = parts.index('telegram_messages') + 2
+    else:
+        # If 'telegram_messages' not found, use the directory after the first date-like part
+        channel_idx = next(
+            (i + 1 for i, part in enumerate(parts) if DATE_DIR_RE.fullmatch(part)),
+            len(parts)
+        )
     
-    CREATE TABLE IF NOT EXISTS raw.telegram_messages (
-        id BIGSERIAL PRIMARY KEY,
-        channel_username TEXT,
-        message_date TIMESTAMPTZ,
-        message_data JSONB,
-        loaded_at TIMESTAMPTZ DEFAULT NOW()
-    );
+    # The last part is the file itself, so the channel must come before it
+    if channel_idx < len(parts) - 1:
+        return parts[channel_idx]
     
-    CREATE TABLE IF NOT EXISTS raw.telegram_media (
-        id BIGSERIAL PRIMARY KEY,
-        channel_username TEXT,
-        media_date TIMESTAMPTZ,
-        media_data JSONB,
-        loaded_at TIMESTAMPTZ DEFAULT NOW()
-    );
-    """)
+    logger.warning(f"Could not extract channel name from {file_path}")
+    return 'unknown'
+
+
+def write_copy_row(buf, channel, date, payload):
+    """Append one tab-separated row to a COPY buffer (empty field loads as NULL)."""
+    buf.write(f"{channel}\t{date or ''}\t{payload}\n")
+
+
+def copy_buffer(cur, table, columns, buf):
+    """Stream a buffer built by write_copy_row into table with a single COPY."""
+    if not buf.tell():
+        return
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH ({COPY_OPTIONS})",
+        buf,
+        size=COPY_CHUNK_SIZE
+    )
+
+
+def iter_json_items(f, file_path):
+    """
+    Yield (item, serialized item) pairs from a JSON array or NDJSON (.jsonl) file.
+    NDJSON lines are already compact JSON, so they are passed through as-is.
+    """
+    if str(file_path).endswith('.zst'):
+        # The scraper writes one zstd frame per checkpoint
+        f = io.BufferedReader(zstd.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+    if str(file_path).endswith(('.jsonl', '.jsonl.zst')):
+        for line in f:
+            line = line.strip()
+            if line:
+                yield orjson.loads(line), line.decode()
+    else:
+        for item in ijson.items(f, 'item', use_float=True):
+            yield item, orjson.dumps(item).decode()
+
+
+def copy_json_file(cur, file_path, table, columns, channel):
+    """
+    Stream the items of a JSON array or NDJSON file into table.
+    Items are parsed incrementally and flushed every COPY_BATCH_ROWS rows,
+    so memory stays bounded regardless of file size.
+    """
+    buf = io.StringIO()
+    rows = 0
+    with open(file_path, 'rb', buffering=COPY_CHUNK_SIZE) as f:
+        for item, payload in iter_json_items(f, file_path):
+            write_copy_row(buf, channel, item.get('date'), payload)
+            rows += 1
+            if rows % COPY_BATCH_ROWS == 0:
+                copy_buffer(cur, table, columns, buf)
+                buf = io.StringIO()
+    copy_buffer(cur, table, columns, buf)
+    return rows
+
+
+def load_file(pool, file_path, table, columns, channel):
+    """COPY a single file on a pooled connection, committing it on its own."""
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            rows = copy_json_file(cur, file_path, table, columns, channel)
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def ensure_raw_schema(pool):
+    """
+    Bring the raw tables up to date with the migrations, only if they are
+    not already: both tables exist and are unlogged.
+    """
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT count(*) = 2 FROM pg_class"
+                " WHERE oid IN (to_regclass('raw.telegram_messages'), to_regclass('raw.telegram_media'))"
+                " AND relpersistence = 'u'"
+            )
+            if not cur.fetchone()[0]:
+                for migration in sorted(MIGRATIONS_DIR.glob("*.sql")):
+                    cur.execute(migration.read_text(encoding='utf-8'))
+        conn.commit()
+    finally:
+        pool.putconn(conn)
+
+
+def delete_day(pool, day):
+    """
+    Remove the raw rows dated day (YYYY-MM-DD, UTC) before that day's files
+    are loaded again, so re-running a day's load does not duplicate them.
+    """
+    start = datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    bounds = (start, start + timedelta(days=1))
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM raw.telegram_messages WHERE message_date >= %s AND message_date < %s",
+                bounds
+            )
+            cur.execute(
+                "DELETE FROM raw.telegram_media WHERE media_date >= %s AND media_date < %s",
+                bounds
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def load_json_files(pool, base_dir, max_workers=LOAD_WORKERS, day=None):
+    """
+    Load JSON files from directory into PostgreSQL.
+    If day (YYYY-MM-DD) is given, only that day's scrape directory is loaded,
+    replacing any rows already loaded for that day.
+    """
+    ensure_raw_schema(pool)
     
-    # Process message files
-    message_files = glob.glob(f"{base_dir}/telegram_messages/**/messages_*.json", recursive=True)
-    for file_path in message_files:
-        channel = file_path.split('/')[-3]  # Extract channel name from path
-        with open(file_path, 'r', encoding='utf-8') as f:
-            messages = json.load(f)
-            for msg in messages:
-                cur.execute("""
-                    INSERT INTO raw.telegram_messages (channel_username, message_date, message_data)
-                    VALUES (%s, %s, %s)
-                """, (channel, msg.get('date'), json.dumps(msg)))
+    messages_dir = Path(base_dir, "telegram_messages")
+    if day:
+        messages_dir = messages_dir / day
+        delete_day(pool, day)
     
-    # Process media info files
-    media_files = glob.glob(f"{base_dir}/telegram_messages/**/media_info_*.json", recursive=True)
-    for file_path in media_files:
-        channel = get_channel_name_from_path(file_path)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            media_items = json.load(f)
-            for media in media_items:
-                cur.execute("""
-                    INSERT INTO raw.telegram_media (channel_username, media_date, media_data)
-                    VALUES (%s, %s, %s)
-                """, (channel, media.get('date'), json.dumps(media)))
+    # Walk the tree once and route message and media info files by name
+    jobs = []
+    for file_path in messages_dir.rglob("*.json*"):
+        if not file_path.name.endswith(JSON_SUFFIXES):
+            continue
+        if file_path.name.startswith("messages_"):
+            target = ("raw.telegram_messages", MESSAGE_COLUMNS)
+        elif file_path.name.startswith("media_info_"):
+            target = ("raw.telegram_media", MEDIA_COLUMNS)
+        else:
+            continue
+        jobs.append((file_path, *target, get_channel_name_from_path(file_path)))
     
-    conn.commit()
-    cur.close()
+    # Each file is committed independently, so one bad file does not roll back the rest
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(lambda job: load_file(pool, *job), jobs))
 
 if __name__ == "__main__":
-    # Database connection
-    conn = psycopg2.connect(
+    # Database connection pool, one connection per loader thread
+    pool = ThreadedConnectionPool(
+        1,
+        LOAD_WORKERS,
         dbname=os.getenv("POSTGRES_DB"),
         user=os.getenv("POSTGRES_USER"),
         password=os.getenv("POSTGRES_PASSWORD"),
@@ -105,9 +227,9 @@ if __name__ == "__main__":
     base_dir = "data/raw"
     
     try:
-        load_json_files(conn, base_dir)
+        load_json_files(pool, base_dir)
         print("Data loaded successfully!")
     except Exception as e:
         print(f"Error loading data: {e}")
     finally:
-        conn.close()
+        pool.closeall()
@@ -0,0 +1,20 @@
+-- scripts/migrations/001_raw_schema.sql
+-- Raw staging tables for scraped Telegram data. They are append-only and can
+-- be reloaded from the JSON files on disk, so they are UNLOGGED to skip WAL.
+CREATE SCHEMA IF NOT EXISTS raw;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS raw.telegram_messages (
+    id BIGSERIAL PRIMARY KEY,
+    channel_username TEXT,
+    message_date TIMESTAMPTZ,
+    message_data JSONB,
+    loaded_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS raw.telegram_media (
+    id BIGSERIAL PRIMARY KEY,
+    channel_username TEXT,
+    media_date TIMESTAMPTZ,
+    media_data JSONB,
+    loaded_at TIMESTAMPTZ DEFAULT NOW()
+);
@@ -0,0 +1,13 @@
+-- scripts/migrations/002_raw_unlogged.sql
+-- 001 only creates the raw tables UNLOGGED when they do not exist yet; switch
+-- tables created by earlier deployments over too. Tables that are already
+-- unlogged are left alone, so this can be re-run.
+DO $$
+BEGIN
+    IF (SELECT relpersistence FROM pg_class WHERE oid = 'raw.telegram_messages'::regclass) = 'p' THEN
+        ALTER TABLE raw.telegram_messages SET UNLOGGED;
+    END IF;
+    IF (SELECT relpersistence FROM pg_class WHERE oid = 'raw.telegram_media'::regclass) = 'p' THEN
+        ALTER TABLE raw.telegram_media SET UNLOGGED;
+    END IF;
+END $$;
@@ -1,4 +1,4 @@
-import json
+import orjson
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -36,8 +36,8 @@ class DataProcessor:
             }
             
             # Save to file
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
             
             logger.info(f"Saved {len(messages)} messages to {output_path}")
             return str(output_path)
@@ -6,17 +6,195 @@ This script scrapes messages and media from specified Telegram channels.
 """
 
 import asyncio
+import io
 import json
 import os
 import sys
-from datetime import datetime
-from typing import List, Dict, Any, Optional, Set
+import time
+from collections import Counter
+from functools import cache
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple
 from pathlib import Path
 
+import orjson
+import zstandard as zstd
+from telethon import errors
+
 from config.config import config
-from services.telegram_service import TelegramService
+from services.telegram_service import MessageRow, TelegramService
 from processors.data_processor import DataProcessor
-from utils.logger import default_logger as logger
+from utils.logger import default_logger as logger, log_error_sampled
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize obj as one compact NDJSON line."""
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+
+# Media info records written between flushes of the media info file
+MEDIA_FLUSH_INTERVAL = 100
+
+# Messages written between durable checkpoints of the messages file
+CHECKPOINT_INTERVAL = 1000
+
+# Fetched messages that may wait for the writer before fetching pauses
+MESSAGE_QUEUE_SIZE = 1024
+
+@cache
+def message_fields() -> Tuple[str, ...]:
+    """
+    Return the configured MESSAGE_FIELDS that get_messages provides, warning
+    once about any it does not. 'id' is always included: checkpoints,
+    resuming and find_latest_scrape all read it back.
+    """
+    known = MessageRow.__dataclass_fields__
+    unknown = [k for k in config.MESSAGE_FIELDS if k not in known]
+    if unknown:
+        logger.warning(f"Ignoring unknown MESSAGE_FIELDS: {', '.join(unknown)} (available: {', '.join(known)})")
+    fields = dict.fromkeys(k for k in ('id', *config.MESSAGE_FIELDS) if k in known)
+    return tuple(fields)
+
+def find_checkpoint(channel_dir: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return the newest unfinished checkpoint in channel_dir, if any.
+    Checkpoints are removed once a scrape completes, so any that remain
+    belong to an interrupted run that can be resumed.
+    """
+    checkpoints = sorted(channel_dir.glob('messages_*.ckpt'))
+    if not checkpoints:
+        return None
+    with open(checkpoints[-1], 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    state['checkpoint_file'] = str(checkpoints[-1])
+    return state
+
+def read_first_line(path: str) -> bytes:
+    """Return the first line of a (possibly zstd-compressed) NDJSON file."""
+    with open(path, 'rb') as f:
+        if path.endswith('.zst'):
+            f = io.BufferedReader(zstd.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+        return f.readline()
+
+def find_latest_scrape(channel_dir: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return the newest completed messages file in channel_dir with its mtime
+    and the highest message id saved so far, or None if there is none.
+    Messages are fetched newest first, so a file's first line has its
+    highest id; files from runs that found nothing new are empty.
+    """
+    scrapes = []
+    with os.scandir(channel_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('messages_') and entry.name.endswith(('.jsonl', '.jsonl.zst')):
+                scrapes.append((entry.stat().st_mtime, entry.path))
+    if not scrapes:
+        return None
+    scrapes.sort(reverse=True)
+    last_id = 0
+    for _, path in scrapes:
+        line = read_first_line(path)
+        if line.strip():
+            last_id = json.loads(line)['id']
+            break
+    return {'messages_file': scrapes[0][1], 'mtime': scrapes[0][0], 'last_id': last_id}
+
+class NDJSONWriter:
+    """
+    Append-only NDJSON writer for use inside the event loop.
+    
+    Lines are batched in memory and written from a worker thread, so disk I/O
+    never stalls the loop. Use a single writer per file. Paths ending in .zst
+    are written as a zstd stream, one frame per checkpoint.
+    
+    With atomic=True, data goes to path + '.tmp', which is renamed over path
+    only when the writer exits cleanly, so path never holds a partial file.
+    Use it for files that are resumed from a checkpoint; otherwise data is
+    written straight to path, where every flushed line is already usable.
+    """
+    
+    def __init__(self, path: str, batch_bytes: int = 1 << 20, offset: int = 0, atomic: bool = False):
+        self.path = path
+        self.tmp_path = path + '.tmp' if atomic else path
+        self.batch_bytes = batch_bytes
+        self.offset = offset
+        self.compress = path.endswith('.zst')
+        self._raw = None
+        self._file = None
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+    
+    async def __aenter__(self):
+        self._file = await asyncio.to_thread(self._open)
+        return self
+    
+    def _open(self):
+        # The zstd writer batches its output itself, so the file under it
+        # needs a much smaller buffer than plain NDJSON does
+        buffering = 1 << 16 if self.compress else 1 << 20
+        if not self.offset:
+            self._raw = open(self.tmp_path, 'wb', buffering=buffering)
+        else:
+            # A run that stopped between renaming the file and clearing its
+            # checkpoint left only the final file; take it back to resume
+            if not os.path.exists(self.tmp_path) and os.path.exists(self.path):
+                os.replace(self.path, self.tmp_path)
+            # Resuming: drop anything written after the last checkpoint
+            # (for .zst files the offset is a frame boundary)
+            self._raw = open(self.tmp_path, 'r+b', buffering=buffering)
+            self._raw.truncate(self.offset)
+            self._raw.seek(self.offset)
+        if self.compress:
+            return zstd.ZstdCompressor(level=3, threads=2).stream_writer(self._raw)
+        return self._raw
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.flush()
+        finally:
+            await asyncio.to_thread(self._file.close)
+        # Leave an interrupted file under its temporary name for resuming
+        if exc_type is None and self.tmp_path != self.path:
+            await asyncio.to_thread(os.replace, self.tmp_path, self.path)
+    
+    async def write(self, obj: Any) -> None:
+        """Queue one object; the batch is written once it reaches batch_bytes."""
+        line = dumps_line(obj)
+        self._pending.append(line)
+        self._pending_bytes += len(line)
+        if self._pending_bytes >= self.batch_bytes:
+            await self._write_pending()
+    
+    async def _write_pending(self) -> None:
+        if self._pending:
+            data = b''.join(self._pending)
+            self._pending = []
+            self._pending_bytes = 0
+            await asyncio.to_thread(self._file.write, data)
+    
+    async def flush(self) -> None:
+        """Write out everything queued so far and flush it to the OS."""
+        await self._write_pending()
+        await asyncio.to_thread(self._file.flush)
+    
+    async def checkpoint(self, checkpoint_file: str, **state: Any) -> None:
+        """
+        Make everything written so far durable and record it in a sidecar file.
+        The sidecar stores the byte offset of the durable data plus state, and
+        is replaced atomically so it always points at a consistent prefix.
+        """
+        await self._write_pending()
+        if self.compress:
+            # End the frame so the offset is a point a reader can stop at
+            await asyncio.to_thread(self._file.flush, zstd.FLUSH_FRAME)
+        await asyncio.to_thread(self._raw.flush)
+        await asyncio.to_thread(os.fsync, self._raw.fileno())
+        state['offset'] = self._raw.tell()
+        await asyncio.to_thread(_write_json_atomic, checkpoint_file, state)
+
+def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
 
 class TelegramScraper:
     """Main scraper class that orchestrates the scraping process."""
@@ -24,6 +202,25 @@ class TelegramScraper:
     def __init__(self):
         self.telegram = TelegramService()
         self.data_processor = DataProcessor()
+        
+        # Shared by every channel task: cleared while Telegram asks us to back
+        # off, so all workers pause instead of piling more requests on
+        self._flood_gate = asyncio.Event()
+        self._flood_gate.set()
+        self._flood_until = 0.0
+        
+        # Per-message errors seen so far, by type, for sampling tracebacks
+        self._error_counts: Counter = Counter()
+    
+    async def _wait_out_flood(self, seconds: int) -> None:
+        """Close the flood gate for all workers until the FLOOD_WAIT has elapsed."""
+        loop = asyncio.get_running_loop()
+        self._flood_until = max(self._flood_until, loop.time() + seconds)
+        self._flood_gate.clear()
+        logger.warning(f"Telegram FLOOD_WAIT of {seconds}s, pausing all channels")
+        while (delay := self._flood_until - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        self._flood_gate.set()
     
     async def scrape_channel(
         self,
@@ -42,6 +239,7 @@ class TelegramScraper:
         max_wait: int = 5,
         max_retries: int = 3,
         reverse: bool = False,
+        day: Optional[str] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -50,6 +248,10 @@ class TelegramScraper:
         This method performs two main tasks:
         1. Fetches and saves all messages from the channel
         2. Fetches and saves all media files from the channel separately
+        
+        If `day` (YYYY-MM-DD) is given, only messages and media sent that day
+        (UTC) are fetched and written under that day's directory. Without it
+        the whole history is scraped into today's directory.
         """
         result = {
             'channel': channel_username,
@@ -64,6 +266,7 @@ class TelegramScraper:
         try:
             # Get channel info
             try:
+                await self._flood_gate.wait()
                 channel_info = await self.telegram.get_channel_info(channel_username)
                 logger.info(f"Scraping channel: {channel_info.get('title', channel_username)}")
             except Exception as e:
@@ -72,103 +275,178 @@ class TelegramScraper:
                 return result
             
             # Create directory for this channel's data
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            channel_dir = os.path.join(
-                config.DATA_DIR,
-                'raw',
-                'telegram_messages',
-                datetime.now().strftime('%Y-%m-%d'),
-                channel_username
-            )
-            os.makedirs(channel_dir, exist_ok=True)
+            # Read the clock and cwd once so the timestamp and day always agree
+            now = datetime.now()
+            timestamp = now.strftime('%Y%m%d_%H%M%S')
+            window: Dict[str, datetime] = {}
+            if day:
+                day_start = datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                window = {'min_date': day_start, 'offset_date': day_start + timedelta(days=1)}
+            day = day or now.strftime('%Y-%m-%d')
+            cwd = os.getcwd()
+            channel_dir = Path(config.DATA_DIR) / 'raw' / 'telegram_messages' / day / channel_username
+            channel_dir.mkdir(parents=True, exist_ok=True)
+            
+            # An interrupted run left a checkpoint behind; otherwise a finished
+            # scrape of this day only needs messages newer than what it saved
+            resume = find_checkpoint(channel_dir)
+            latest = None if resume else find_latest_scrape(channel_dir)
+            if latest and now.timestamp() - latest['mtime'] < config.SCRAPE_TTL:
+                logger.info(f"Skipping {channel_username}: {latest['messages_file']} is less than {config.SCRAPE_TTL}s old")
+                result['messages_file'] = latest['messages_file']
+                result['status'] = 'success'
+                return result
             
             # 1. Create directories for messages and media
             # Media will be saved in a separate directory structure
-            media_base_dir = os.path.join('data', 'raw', 'telegram_media')
-            media_dir = os.path.join(media_base_dir, channel_username, timestamp)
-            os.makedirs(media_dir, exist_ok=True)
-            logger.info(f"Media files will be saved to: {os.path.abspath(media_dir)}")
+            media_dir = Path('data') / 'raw' / 'telegram_media' / channel_username / timestamp
+            media_dir.mkdir(parents=True, exist_ok=True)
+            media_dir_abs = os.path.join(cwd, media_dir)
+            logger.info(f"Media files will be saved to: {media_dir_abs}")
             
             # 2. First, collect and save messages (without media)
-            messages = []
-            message_count = 0
+            # Messages are streamed to disk as NDJSON, one object per line.
+            if resume:
+                messages_file = resume['messages_file']
+                checkpoint_file = resume['checkpoint_file']
+                message_count = resume['count']
+                last_id = resume['last_id']
+                min_id = resume.get('min_id', 0)
+                logger.info(f"Resuming {messages_file} after message {last_id} ({message_count} saved)")
+            else:
+                messages_file = str(channel_dir / f"messages_{timestamp}.jsonl.zst")
+                checkpoint_file = str(channel_dir / f"messages_{timestamp}.ckpt")
+                message_count = 0
+                last_id = 0
+                min_id = latest['last_id'] if latest else 0
+                if min_id:
+                    logger.info(f"Fetching only messages newer than {min_id}")
             
             logger.info(f"Starting to collect up to {limit} messages from {channel_username}")
             
-            async for message in self.telegram.get_messages(channel_username, limit=limit):
+            # Fetching and writing run as separate tasks joined by a bounded
+            # queue, so a slow disk does not stall the network pull
+            queue: asyncio.Queue = asyncio.Queue(maxsize=MESSAGE_QUEUE_SIZE)
+            
+            # Messages already saved before this run's fetch starts; the writer
+            # keeps advancing message_count while fetch_messages retries
+            start_count = message_count
+            
+            async def fetch_messages() -> None:
+                fetched, offset_id = 0, last_id
+                fields = message_fields()
                 try:
-                    message_dict = message.to_dict() if hasattr(message, 'to_dict') else {}
-                    
-                    # Remove media from message to keep it clean
-                    if 'media' in message_dict:
-                        del message_dict['media']
-                        
-                    messages.append(message_dict)
-                    message_count += 1
-                    
-                    # Log progress every 100 messages and save periodically
-                    if message_count % 100 == 0:
-                        logger.info(f"Collected {message_count} messages...")
-                        
-                    # Save progress every 1000 messages to prevent data loss
-                    if message_count % 1000 == 0:
-                        messages_file = os.path.join(channel_dir, f"messages_{timestamp}_partial_{message_count}.json")
-                        with open(messages_file, 'w', encoding='utf-8') as f:
-                            json.dump(messages, f, ensure_ascii=False, indent=2)
-                        logger.info(f"Saved partial progress at {message_count} messages")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing message {message_count}: {e}", exc_info=True)
-                    continue
-                    
-            # Save final messages to file
-            messages_file = os.path.join(channel_dir, f"messages_{timestamp}.json")
-            with open(messages_file, 'w', encoding='utf-8') as f:
-                json.dump(messages, f, ensure_ascii=False, indent=2)
+                    while True:
+                        await self._flood_gate.wait()
+                        try:
+                            async for message in self.telegram.get_messages(
+                                channel_username,
+                                limit=limit - start_count - fetched,
+                                offset_id=offset_id,
+                                min_id=min_id,
+                                **window
+                            ):
+                                # Keep only the configured fields (media is saved separately)
+                                message_dict = {k: getattr(message, k) for k in fields}
+                                fetched += 1
+                                offset_id = message_dict['id']
+                                await queue.put(message_dict)
+                            break
+                        except errors.FloodWaitError as e:
+                            # Resume after the last message fetched once the wait is over
+                            await self._wait_out_flood(e.seconds)
+                finally:
+                    # Tell the writer we are done, unless it is the one cancelling us
+                    if not asyncio.current_task().cancelling():
+                        await queue.put(None)
+            
+            async with NDJSONWriter(messages_file, offset=resume['offset'] if resume else 0, atomic=True) as writer:
+                producer = asyncio.create_task(fetch_messages())
+                last_log = time.monotonic()
+                try:
+                    while (message_dict := await queue.get()) is not None:
+                        try:
+                            await writer.write(message_dict)
+                            message_count += 1
+                            last_id = message_dict['id']
+                            
+                            # Log progress at most once per interval
+                            if time.monotonic() - last_log >= config.PROGRESS_LOG_INTERVAL:
+                                logger.info("Collected %d messages...", message_count)
+                                last_log = time.monotonic()
+                            
+                            # Make progress durable so an interrupted run can resume
+                            if message_count % CHECKPOINT_INTERVAL == 0:
+                                await writer.checkpoint(
+                                    checkpoint_file,
+                                    messages_file=messages_file,
+                                    count=message_count,
+                                    last_id=last_id,
+                                    min_id=min_id
+                                )
+                                
+                        except Exception as e:
+                            log_error_sampled(logger, self._error_counts, f"Error processing message {message_count}: {e}", e)
+                            continue
+                except BaseException:
+                    producer.cancel()
+                    raise
+                # Surface any error raised while fetching
+                await producer
+            
+            # The messages file is complete, so there is nothing left to resume
+            if os.path.exists(checkpoint_file):
+                os.remove(checkpoint_file)
             
             # Store the result
             result['messages_file'] = messages_file
-            result['message_count'] = len(messages)
-            logger.info(f"Saved {len(messages)} messages to {messages_file}")
+            result['message_count'] = message_count
+            logger.info(f"Saved {message_count} messages to {messages_file}")
             
             # 3. Now, collect all media files separately
-            media_files = []
+            # Media info is streamed as NDJSON next to the messages file. It is
+            # not resumed, so it is written in place: after an interruption the
+            # lines flushed so far still describe files that were downloaded.
+            media_info_file = str(channel_dir / f'media_info_{timestamp}.jsonl')
             media_count = 0
             
             logger.info(f"Starting to collect media files from {channel_username}")
             try:
-                # Pass the media directory for downloading files
-                try:
-                    async for media_info in self.telegram.get_channel_media(
-                        channel_username, 
-                        limit=limit,
-                        download_path=media_dir  # This will trigger file downloads
-                    ):
-                        if media_info:
-                            media_files.append(media_info)
-                            media_count += 1
-                            
-                            # Log progress every 10 media files
-                            if media_count % 10 == 0:
-                                logger.info(f"Collected {media_count} media files...")
-                except Exception as e:
-                    logger.error(f"Error processing media: {str(e)}", exc_info=True)
+                async with NDJSONWriter(media_info_file) as media_writer:
+                    # Pass the media directory for downloading files
+                    await self._flood_gate.wait()
+                    try:
+                        async for media_info in self.telegram.get_channel_media(
+                            channel_username, 
+                            limit=limit,
+                            min_id=min_id,
+                            download_path=str(media_dir),  # This will trigger file downloads
+                            **window
+                        ):
+                            if media_info:
+                                # Update file path to be relative to the project root
+                                if media_info.get('file_path'):
+                                    media_info['file_path'] = os.path.relpath(media_info['file_path'], cwd)
+                                await media_writer.write(media_info)
+                                media_count += 1
+                                
+                                # Log progress every 10 media files
+                                if media_count % 10 == 0:
+                                    logger.info(f"Collected {media_count} media files...")
+                                
+                                # Flush periodically so an interrupted scrape keeps what it has
+                                if media_count % MEDIA_FLUSH_INTERVAL == 0:
+                                    await media_writer.flush()
+                    except Exception as e:
+                        logger.error(f"Error processing media: {str(e)}", exc_info=True)
                 
-                # Save media info to file in the messages directory
-                if media_files:
-                    media_info_file = os.path.join(channel_dir, f'media_info_{timestamp}.json')
-                    with open(media_info_file, 'w', encoding='utf-8') as f:
-                        # Update file paths in media info to be relative to the project root
-                        for media in media_files:
-                            if 'file_path' in media:
-                                media['file_path'] = os.path.relpath(media['file_path'], os.getcwd())
-                        json.dump(media_files, f, ensure_ascii=False, indent=2)
-                    
+                if media_count:
                     result['media_info_file'] = media_info_file
-                    result['media_count'] = len(media_files)
-                    logger.info(f"Saved info for {len(media_files)} media files to {media_info_file}")
-                    logger.info(f"Media files saved to: {os.path.abspath(media_dir)}")
-                    logger.info(f"Saved info for {len(media_files)} media files to {media_info_file}")
+                    result['media_count'] = media_count
+                    logger.info(f"Saved info for {media_count} media files to {media_info_file}")
+                    logger.info(f"Media files saved to: {media_dir_abs}")
+                else:
+                    os.remove(media_info_file)
                 
                 # Update status
                 result['status'] = 'success'
@@ -184,8 +462,12 @@ class TelegramScraper:
             logger.error(f"Error scraping channel {channel_username}: {str(e)}", exc_info=True)
             return result
 
-async def main():
-    """Main function to run the scraper."""
+async def main(day: Optional[str] = None):
+    """
+    Main function to run the scraper.
+    Raises if Telegram is not authorized or if every channel fails, so
+    callers such as the Dagster op see the failure.
+    """
     # List of channels to scrape
     channels = [
         'CheMed123',
@@ -196,33 +478,46 @@ async def main():
     # Initialize scraper
     scraper = TelegramScraper()
     
-    # Ensure we're connected
+    # Always release the client and its session file, even when run
+    # in-process by a long-lived caller
     try:
-        await scraper.telegram.connect()
+        # Ensure we're connected
+        try:
+            await scraper.telegram.connect()
+        except Exception as e:
+            logger.error(f"Failed to connect to Telegram: {str(e)}")
+            print("\nAuthentication required. Please run:")
+            print("python scripts/auth_telegram.py\n")
+            raise
         if not scraper.telegram._is_connected:
             logger.error("Failed to connect to Telegram. Please run auth_telegram.py first to authenticate.")
             print("\nPlease run the authentication script first:")
             print("python scripts/auth_telegram.py\n")
-            return
-    except Exception as e:
-        logger.error(f"Failed to connect to Telegram: {str(e)}")
-        print("\nAuthentication required. Please run:")
-        print("python scripts/auth_telegram.py\n")
-        return
-    
-    # Process each channel
-    for channel in channels:
-        logger.info(f"\n{'='*50}")
-        logger.info(f"Starting scrape for: {channel}")
-        logger.info(f"{'='*50}")
+            raise RuntimeError("Telegram session is not authorized; run scripts/auth_telegram.py")
         
-        try:
-            # Scrape the channel
-            result = await scraper.scrape_channel(channel, limit=100000)
+        # Channels are scraped concurrently on the shared client, bounded so we
+        # stay within Telegram's per-account limits
+        sem = asyncio.Semaphore(config.MAX_CONCURRENT_CHANNELS)
+        
+        async def run_one(channel: str) -> Dict[str, Any]:
+            async with sem:
+                logger.info(f"\n{'='*50}")
+                logger.info(f"Starting scrape for: {channel}")
+                logger.info(f"{'='*50}")
+                return await scraper.scrape_channel(channel, limit=100000, day=day)
+        
+        results = await asyncio.gather(*(run_one(c) for c in channels), return_exceptions=True)
+        
+        failed = []
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing channel {channel}: {str(result)}", exc_info=result)
+                failed.append(channel)
+                continue
             
             # Log results
             if result['status'] == 'success':
-                logger.info(f"Successfully scraped {result['message_count']} messages")
+                logger.info(f"Successfully scraped {result['message_count']} messages from {channel}")
                 logger.info(f"Downloaded {result['media_count']} media files")
                 if result.get('messages_file'):
                     logger.info(f"Messages saved to: {result['messages_file']}")
@@ -231,9 +526,12 @@ async def main():
             else:
                 error_msg = result.get('error', 'Unknown error')
                 logger.error(f"Failed to scrape {channel}: {error_msg}")
-                
-        except Exception as e:
-            logger.error(f"Error processing channel {channel}: {str(e)}", exc_info=True)
+                failed.append(channel)
+        
+        if len(failed) == len(channels):
+            raise RuntimeError(f"Scraping failed for every channel: {', '.join(failed)}")
+    finally:
+        await scraper.telegram.disconnect()
 
 if __name__ == "__main__":
     try:
@@ -1,15 +1,161 @@
 import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 import json
+import logging
+import operator
 import os
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Any, AsyncGenerator
+from typing import Dict, List, Optional, Any, AsyncGenerator, Set
 
+from aiolimiter import AsyncLimiter
 from telethon import TelegramClient, errors
-from telethon.tl.types import Message, MessageMediaPhoto, MessageMediaDocument
+from telethon.tl.types import (
+    Message,
+    MessageMediaPhoto,
+    MessageMediaDocument,
+    InputMessagesFilterDocument,
+    InputMessagesFilterPhotos,
+    InputMessagesFilterPhotoVideo,
+    InputMessagesFilterVideo,
+)
 
 from config.config import config
-from utils.logger import default_logger as logger
+from utils.logger import default_logger as logger, log_error_sampled
+
+# Telethon picks up cryptg's C implementation of MTProto's AES when it is
+# installed; without it every downloaded byte is decrypted in pure Python
+try:
+    import cryptg  # noqa: F401
+    HAS_CRYPTG = True
+except ImportError:
+    HAS_CRYPTG = False
+
+@dataclass(slots=True)
+class MessageRow:
+    """One message as yielded by TelegramService.get_messages."""
+    id: int
+    date: Optional[datetime]
+    message: Optional[str]
+    views: Optional[int]
+    forwards: Optional[int]
+    media: Any = None
+
+# Fields copied from each Telethon message into a MessageRow, in field order
+_get_message_fields = operator.attrgetter('id', 'date', 'message', 'views', 'forwards')
+
+# Media up to this size is downloaded into memory and written out on
+# _disk_pool, so the event loop moves on to the next download meanwhile;
+# larger files are streamed to disk by Telethon to keep memory bounded
+IN_MEMORY_DOWNLOAD_LIMIT = 16 << 20
+_disk_pool = ThreadPoolExecutor(
+    max_workers=(os.cpu_count() or 1) * 2, thread_name_prefix='media-writer'
+)
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Write data to path via a temporary file, so path is never partial."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# Times a download is retried after Telegram asks us to wait
+FLOOD_WAIT_RETRIES = 3
+
+# Finished downloads that may wait for the consumer before downloading pauses
+MEDIA_QUEUE_SIZE = 32
+
+# Kind of media in a document, by full MIME type or its primary token;
+# anything else (PDFs, Word files, ...) is not media
+_MIME_TO_KIND = {'image': 'image', 'video': 'video'}
+
+def document_kind(mime_type: Optional[str]) -> Optional[str]:
+    """Return 'image', 'video' or None for a document's MIME type."""
+    # Drop parameters, as in 'image/jpeg; charset=...'
+    mime_type = (mime_type or '').lower().split(';', 1)[0].strip()
+    return _MIME_TO_KIND.get(mime_type) or _MIME_TO_KIND.get(mime_type.split('/', 1)[0])
+
+# Kind of media carried by each message.media type we can download
+_MEDIA_DISPATCH = {MessageMediaPhoto: 'photo', MessageMediaDocument: 'document'}
+
+# Media attributes copied into media_info, as (attribute, key) pairs
+_MEDIA_ATTRS = (
+    ('id', 'media_id'),
+    ('access_hash', 'access_hash'),
+    ('mime_type', 'mime_type'),
+    ('size', 'file_size'),
+    ('file_name', 'file_name'),
+)
+_MISSING = object()
+
+def media_filters(file_types: List[str]) -> List[Any]:
+    """
+    Return the server-side search filters that together cover file_types,
+    so only media messages are sent to us.
+    """
+    types = set(file_types)
+    filters = []
+    if {'photo', 'video'} <= types:
+        filters.append(InputMessagesFilterPhotoVideo())
+    elif 'photo' in types:
+        filters.append(InputMessagesFilterPhotos())
+    elif 'video' in types:
+        filters.append(InputMessagesFilterVideo())
+    if 'document' in types:
+        filters.append(InputMessagesFilterDocument())
+    return filters
+
+def debug_message(message: Any, position: int) -> None:
+    """Log a message's attributes and any media found on it, for debugging."""
+    logger.debug(f"\n--- Message {position} (ID: {message.id}) ---")
+    logger.debug(f"Date: {message.date}")
+    logger.debug(f"Text: {getattr(message, 'text', 'N/A')}")
+    
+    # Log all message attributes for debugging
+    msg_attrs = [attr for attr in dir(message) if not attr.startswith('_')]
+    logger.debug(f"Message attributes: {', '.join(msg_attrs)}")
+    
+    # Check for media in different ways
+    has_media = False
+    
+    # Check message.media
+    if hasattr(message, 'media') and message.media is not None:
+        has_media = True
+        logger.debug("MEDIA DETECTED: message.media is present")
+        media_attrs = [attr for attr in dir(message.media) if not attr.startswith('_')]
+        logger.debug(f"Media attributes: {', '.join(media_attrs)}")
+        
+        # Check for document
+        if hasattr(message.media, 'document'):
+            doc = message.media.document
+            logger.debug("Document found in message.media.document")
+            logger.debug(f"Document ID: {getattr(doc, 'id', 'N/A')}")
+            logger.debug(f"Document MIME: {getattr(doc, 'mime_type', 'N/A')}")
+            logger.debug(f"Document size: {getattr(doc, 'size', 'N/A')} bytes")
+        
+        # Check for photo
+        if hasattr(message.media, 'photo'):
+            logger.debug("Photo found in message.media.photo")
+            
+    # Check for photo attribute directly on message
+    if hasattr(message, 'photo') and message.photo:
+        has_media = True
+        logger.debug("MEDIA DETECTED: message.photo is present")
+        logger.debug(f"Photo ID: {getattr(message.photo, 'id', 'N/A')}")
+        
+    # Check for document attribute directly on message
+    if hasattr(message, 'document') and message.document:
+        has_media = True
+        doc = message.document
+        logger.debug("DOCUMENT DETECTED: message.document is present")
+        logger.debug(f"Document ID: {getattr(doc, 'id', 'N/A')}")
+        logger.debug(f"Document MIME: {getattr(doc, 'mime_type', 'N/A')}")
+        
+    if not has_media:
+        logger.debug("NO MEDIA DETECTED in this message")
 
 class TelegramService:
     """Service for interacting with Telegram API."""
@@ -19,6 +165,19 @@ class TelegramService:
         self.client = None
         self._is_connected = False
         
+        # Resolved entities by username and id; they don't change while we run
+        self._entity_cache: Dict[Any, Any] = {}
+        
+        # Shared request budget for everything this service starts, so
+        # concurrent channels and downloads stay under Telegram's flood limits
+        self._rate_limiter = AsyncLimiter(config.TELEGRAM_REQUESTS_PER_SECOND, 1.0)
+        
+        # Per-media errors seen so far, by type, for sampling tracebacks
+        self._error_counts: Counter = Counter()
+        
+        # Download directories already created by this service
+        self._dirs_created: Set[str] = set()
+        
         # Get the absolute path for the session file
         self.session_path = os.path.abspath(config.SESSION_NAME)
         
@@ -71,6 +230,8 @@ class TelegramService:
                 
                 self._is_connected = True
                 logger.info("Successfully connected to Telegram")
+                if not HAS_CRYPTG:
+                    logger.warning("cryptg is not installed; media downloads will be much slower")
                 return
                 
             except Exception as e:
@@ -87,11 +248,27 @@ class TelegramService:
                     raise
     
     async def disconnect(self) -> None:
-        """Disconnect from Telegram."""
-        if self._is_connected and self.client:
+        """Disconnect from Telegram, including a connection left unauthorized."""
+        if self.client and self.client.is_connected():
             await self.client.disconnect()
-            self._is_connected = False
             logger.info("Disconnected from Telegram")
+        self._is_connected = False
+    
+    def _ensure_dir(self, path: str) -> None:
+        """Create path once per service instead of once per download."""
+        if path not in self._dirs_created:
+            os.makedirs(path, exist_ok=True)
+            self._dirs_created.add(path)
+    
+    async def _resolve(self, key: Any) -> Any:
+        """Return the entity for a username or id, resolving it only once."""
+        entity = self._entity_cache.get(key)
+        if entity is None:
+            async with self._rate_limiter:
+                entity = await self.client.get_entity(key)
+            self._entity_cache[key] = entity
+            self._entity_cache[entity.id] = entity
+        return entity
     
     async def get_channel_info(self, channel_username: str) -> Dict[str, Any]:
         """Get information about a channel."""
@@ -102,7 +279,7 @@ class TelegramService:
                 
             # Get the entity
             try:
-                entity = await self.client.get_entity(channel_username)
+                entity = await self._resolve(channel_username)
             except (ValueError, TypeError) as e:
                 # If we get a ValueError, the channel might not exist or we don't have access
                 logger.error(f"Could not find channel {channel_username}. Make sure the username is correct and you have access to it.")
@@ -125,8 +302,12 @@ class TelegramService:
         self,
         channel_username: str,
         limit: int = 100000,  # Increased default limit to 50,000
+        min_id: int = 0,
         file_types: Optional[List[str]] = None,
-        download_path: Optional[str] = None
+        download_path: Optional[str] = None,
+        max_downloads: Optional[int] = None,
+        offset_date: Optional[datetime] = None,
+        min_date: Optional[datetime] = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Get all media files from a channel and optionally download them.
@@ -134,12 +315,18 @@ class TelegramService:
         Args:
             channel_username: Username or ID of the channel
             limit: Maximum number of media files to fetch
+            min_id: Only consider messages newer than this message id
             file_types: List of file types to include (e.g. ['photo', 'document', 'video'])
                       If None, all media types will be included
             download_path: Directory where to save the media files. If None, files won't be downloaded.
+            max_downloads: Maximum number of downloads in flight at once
+                      (defaults to config.MAX_CONCURRENT_DOWNLOADS)
+            offset_date: Only consider messages sent before this time
+            min_date: Only consider messages sent at or after this time
                       
         Yields:
-            Dict containing media information and local file path if downloaded
+            Dict containing media information and local file path if downloaded,
+            in completion order rather than message order
         """
         if file_types is None:
             file_types = ['photo', 'document', 'video']
@@ -152,60 +339,143 @@ class TelegramService:
             logger.info(f"Fetching up to {limit} media files from {channel_username}")
             
             # Get the channel entity
-            channel = await self.client.get_entity(channel_username)
+            channel = await self._resolve(channel_username)
             logger.info(f"Channel info: ID={channel.id}, Title={getattr(channel, 'title', 'N/A')}")
             
             # Create download directory if it doesn't exist
             if download_path:
-                os.makedirs(download_path, exist_ok=True)
+                self._ensure_dir(download_path)
                 logger.info(f"Media files will be saved to: {os.path.abspath(download_path)}")
             
             media_count = 0
-            total_processed = 0
             
-            # Use a larger limit to account for non-media messages
-            fetch_limit = min(limit * 3, 100000)  # Cap at 100,000 messages to prevent memory issues
+            # Telegram filters by media type server-side, so every message we
+            # receive is a candidate and there's no need to over-fetch
+            filters = media_filters(file_types)
             
-            async for message in self.client.iter_messages(channel, limit=fetch_limit):
-                if media_count >= limit:
-                    break
-                    
-                total_processed += 1
-                
-                # Log progress every 100 messages processed
-                if total_processed % 100 == 0:
-                    logger.info(f"Scanned {total_processed} messages, found {media_count} media files...")
-                
+            # Downloads are network-bound, so run up to max_downloads of them at
+            # once. Each finished download puts its result on a bounded queue
+            # and holds its slot until there is room, so a slow consumer
+            # pauses new downloads instead of piling up results.
+            sem = asyncio.Semaphore(max_downloads or config.MAX_CONCURRENT_DOWNLOADS)
+            results: asyncio.Queue = asyncio.Queue(maxsize=MEDIA_QUEUE_SIZE)
+            
+            async def schedule_downloads() -> None:
+                total_processed = 0
+                scheduled = 0
+                last_log = time.monotonic()
                 try:
-                    media_info = None
-                    
-                    # Check for different media types
-                    if hasattr(message, 'photo') and 'photo' in file_types:
-                        media_info = await self._process_media(message, 'photo', download_path)
-                    elif hasattr(message, 'document') and 'document' in file_types:
-                        # Skip non-media documents (like PDFs, DOCs) if needed
-                        mime_type = getattr(message.document, 'mime_type', '').lower()
-                        if not mime_type or any(x in mime_type for x in ['image/', 'video/']):
-                            media_info = await self._process_media(message, 'document', download_path)
-                    elif hasattr(message, 'video') and 'video' in file_types:
-                        media_info = await self._process_media(message, 'video', download_path)
-                    
-                    if media_info:
-                        media_count += 1
-                        yield media_info
-                        
-                        # Log progress every 10 media files
-                        if media_count % 10 == 0:
-                            logger.info(f"Downloaded {media_count} media files...")
+                    # The task group waits for every download, and cancels the
+                    # rest together if one of them fails or we are cancelled
+                    async with asyncio.TaskGroup() as downloads:
+                        async for message in self._iter_filtered_messages(channel, filters, limit, min_id, offset_date, min_date):
+                            if scheduled >= limit:
+                                break
+                                
+                            total_processed += 1
                             
-                except Exception as e:
-                    logger.error(f"Error processing media from message {getattr(message, 'id', 'unknown')}: {str(e)}", exc_info=True)
-                    continue
+                            # Log progress at most once per interval
+                            if time.monotonic() - last_log >= config.PROGRESS_LOG_INTERVAL:
+                                logger.info("Scanned %d messages, found %d media files...", total_processed, media_count)
+                                last_log = time.monotonic()
+                            
+                            # Check for different media types
+                            media_type = None
+                            kind = _MEDIA_DISPATCH.get(type(message.media))
+                            if kind == 'photo':
+                                if 'photo' in file_types:
+                                    media_type = 'photo'
+                            elif kind == 'document':
+                                mime_type = getattr(message.media.document, 'mime_type', None)
+                                doc_kind = document_kind(mime_type)
+                                # Skip non-media documents (like PDFs, DOCs) if needed
+                                if 'document' in file_types and (not mime_type or doc_kind):
+                                    media_type = 'document'
+                                elif 'video' in file_types and doc_kind == 'video':
+                                    media_type = 'video'
+                            
+                            if media_type is None or not getattr(message, media_type, None):
+                                continue
+                            
+                            # Wait for a free download slot before scheduling the next one
+                            await sem.acquire()
+                            scheduled += 1
+                            downloads.create_task(
+                                self._bounded_process_media(sem, results, message, media_type, download_path)
+                            )
+                finally:
+                    # Tell the consumer we are done, unless it is the one cancelling us
+                    if not asyncio.current_task().cancelling():
+                        await results.put(None)
+            
+            scheduler = asyncio.create_task(schedule_downloads())
+            try:
+                while (media_info := await results.get()) is not None:
+                    media_count += 1
+                    yield media_info
+                    
+                    # Log progress every 10 media files
+                    if media_count % 10 == 0:
+                        logger.info(f"Downloaded {media_count} media files...")
+            except BaseException:
+                # Don't leave downloads running if the caller stops early
+                scheduler.cancel()
+                raise
+            # Surface any error raised while scheduling or downloading
+            await scheduler
                     
         except Exception as e:
             logger.error(f"Error fetching media from {channel_username}: {str(e)}", exc_info=True)
             raise
 
+    async def _iter_filtered_messages(
+        self,
+        channel,
+        filters: List[Any],
+        limit: int,
+        min_id: int = 0,
+        offset_date: Optional[datetime] = None,
+        min_date: Optional[datetime] = None
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Iterate the messages matching any of filters, newest first. Each filter
+        is its own server-side search; their results are merged by message id
+        and a message matched by more than one is yielded once. Iteration stops
+        at the first message sent before min_date.
+        """
+        iterators = [
+            self.client.iter_messages(channel, limit=limit, min_id=min_id, offset_date=offset_date, filter=f)
+            for f in filters
+        ]
+        heads = [await anext(it, None) for it in iterators]
+        last_id = None
+        count = 0
+        while count < limit:
+            live = [i for i, message in enumerate(heads) if message is not None]
+            if not live:
+                return
+            i = max(live, key=lambda i: heads[i].id)
+            message = heads[i]
+            heads[i] = await anext(iterators[i], None)
+            if min_date and message.date < min_date:
+                return
+            if message.id != last_id:
+                last_id = message.id
+                count += 1
+                yield message
+    
+    async def _bounded_process_media(self, sem: asyncio.Semaphore, results: asyncio.Queue, message, media_type: str, download_path: Optional[str] = None) -> None:
+        """
+        Run _process_media, put its result on results and then release the
+        download slot taken for it.
+        """
+        try:
+            media_info = await self._process_media(message, media_type, download_path)
+            if media_info:
+                await results.put(media_info)
+        finally:
+            sem.release()
+
     async def _process_media(self, message, media_type: str, download_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Process a media message and return its information.
@@ -231,31 +501,26 @@ class TelegramService:
                 'file_path': None
             }
             
-            # Add media-specific attributes
-            if hasattr(media, 'id'):
-                media_info['media_id'] = media.id
-            if hasattr(media, 'access_hash'):
-                media_info['access_hash'] = media.access_hash
-                
-            # Handle document attributes
-            if hasattr(media, 'mime_type'):
-                media_info['mime_type'] = media.mime_type
-            if hasattr(media, 'size'):
-                media_info['file_size'] = media.size
-            if hasattr(media, 'file_name'):
-                media_info['file_name'] = media.file_name
+            # Add media-specific and document attributes
+            for attr, key in _MEDIA_ATTRS:
+                value = getattr(media, attr, _MISSING)
+                if value is not _MISSING:
+                    media_info[key] = value
                 
             # Download the file if download_path is provided
             if download_path and hasattr(message, 'download_media'):
                 try:
-                    # Create the download directory if it doesn't exist
-                    os.makedirs(download_path, exist_ok=True)
-                    
-                    # Download the media file directly using the message's download_media method
-                    # This will automatically handle the file naming and downloading
-                    file_path = await message.download_media(file=download_path)
+                    # get_channel_media creates download_path once up front
+                    file = message.file
+                    file_path = os.path.join(
+                        download_path,
+                        f"{media_type}_{message.date:%Y-%m-%d_%H-%M-%S}_{message.id}{file.ext or ''}"
+                    )
+                    file_path = await self._download(message, file_path, file.size or 0)
                     
-                    if file_path and os.path.exists(file_path):
+                    # Telethon raises if the download fails, and in-memory
+                    # downloads are written by us, so there's no need to stat
+                    if file_path:
                         media_info['file_path'] = os.path.abspath(file_path)
                         media_info['download_success'] = True
                         logger.info(f"Downloaded media to: {file_path}")
@@ -266,14 +531,39 @@ class TelegramService:
                 except Exception as e:
                     media_info['download_error'] = str(e)
                     media_info['download_success'] = False
-                    logger.error(f"Error downloading media: {e}", exc_info=True)
+                    log_error_sampled(logger, self._error_counts, f"Error downloading media: {e}", e)
             
             return media_info
             
         except Exception as e:
-            logger.error(f"Error processing {media_type} media: {e}", exc_info=True)
+            log_error_sampled(logger, self._error_counts, f"Error processing {media_type} media: {e}", e)
             return None
             
+    async def _download(self, message, file_path: str, size: int) -> Optional[str]:
+        """
+        Download a message's media to file_path within the shared rate limit,
+        waiting out any FLOOD_WAIT Telegram returns before retrying.
+        
+        Returns:
+            file_path, or None if there was nothing to download
+        """
+        for attempt in range(FLOOD_WAIT_RETRIES + 1):
+            try:
+                async with self._rate_limiter:
+                    if size > IN_MEMORY_DOWNLOAD_LIMIT:
+                        return await message.download_media(file=file_path)
+                    data = await message.download_media(file=bytes)
+                break
+            except errors.FloodWaitError as e:
+                if attempt == FLOOD_WAIT_RETRIES:
+                    raise
+                logger.warning(f"Telegram FLOOD_WAIT of {e.seconds}s while downloading, waiting")
+                await asyncio.sleep(e.seconds)
+        if not data:
+            return None
+        await asyncio.get_running_loop().run_in_executor(_disk_pool, _atomic_write, file_path, data)
+        return file_path
+    
     def _get_file_extension(self, media_type: str, mime_type: str = None) -> str:
         """Get appropriate file extension based on media type and mime type."""
         if media_type == 'photo':
@@ -295,9 +585,17 @@ class TelegramService:
     async def get_messages(
         self, 
         channel_username: str, 
-        limit: int = 50000  # Increased default limit to 50,000
-    ) -> AsyncGenerator[Dict[str, Any], None]:
-        """Get messages from a channel."""
+        limit: int = 50000,  # Increased default limit to 50,000
+        offset_id: int = 0,
+        min_id: int = 0,
+        offset_date: Optional[datetime] = None,
+        min_date: Optional[datetime] = None
+    ) -> AsyncGenerator[MessageRow, None]:
+        """
+        Get messages from a channel, newest first, optionally only those older
+        than offset_id and/or newer than min_id, and sent in the window
+        [min_date, offset_date).
+        """
         try:
             # Ensure client is connected
             if not self._is_connected or not self.client or not self.client.is_connected():
@@ -306,197 +604,28 @@ class TelegramService:
             logger.info(f"Fetching up to {limit} messages from {channel_username}")
             
             # Get the channel entity
-            channel = await self.client.get_entity(channel_username)
+            channel = await self._resolve(channel_username)
             logger.info(f"Channel info: ID={channel.id}, Title={getattr(channel, 'title', 'N/A')}")
             
             message_count = 0
-            async for message in self.client.iter_messages(channel, limit=limit):
+            async for message in self.client.iter_messages(
+                channel, limit=limit, offset_id=offset_id, min_id=min_id, offset_date=offset_date
+            ):
+                # Messages come newest first, so the window ends at the first older one
+                if min_date and message.date < min_date:
+                    break
                 message_count += 1
                 
-                # Log detailed info for first 10 messages
-                if message_count <= 10:  # Check more messages for media
-                    logger.info(f"\n--- Message {message_count} (ID: {message.id}) ---")
-                    logger.info(f"Date: {message.date}")
-                    logger.info(f"Text: {getattr(message, 'text', 'N/A')}")
-                    
-                    # Log all message attributes for debugging
-                    msg_attrs = [attr for attr in dir(message) if not attr.startswith('_')]
-                    logger.debug(f"Message attributes: {', '.join(msg_attrs)}")
-                    
-                    # Check for media in different ways
-                    has_media = False
-                    
-                    # Check message.media
-                    if hasattr(message, 'media') and message.media is not None:
-                        has_media = True
-                        logger.info("MEDIA DETECTED: message.media is present")
-                        media_attrs = [attr for attr in dir(message.media) if not attr.startswith('_')]
-                        logger.info(f"Media attributes: {', '.join(media_attrs)}")
-                        
-                        # Check for document
-                        if hasattr(message.media, 'document'):
-                            doc = message.media.document
-                            logger.info("Document found in message.media.document")
-                            logger.info(f"Document ID: {getattr(doc, 'id', 'N/A')}")
-                            logger.info(f"Document MIME: {getattr(doc, 'mime_type', 'N/A')}")
-                            logger.info(f"Document size: {getattr(doc, 'size', 'N/A')} bytes")
-                        
-                        # Check for photo
-                        if hasattr(message.media, 'photo'):
-                            logger.info("Photo found in message.media.photo")
-                            
-                    # Check for photo attribute directly on message
-                    if hasattr(message, 'photo') and message.photo:
-                        has_media = True
-                        logger.info("MEDIA DETECTED: message.photo is present")
-                        logger.info(f"Photo ID: {getattr(message.photo, 'id', 'N/A')}")
-                        
-                    # Check for document attribute directly on message
-                    if hasattr(message, 'document') and message.document:
-                        has_media = True
-                        doc = message.document
-                        logger.info("DOCUMENT DETECTED: message.document is present")
-                        logger.info(f"Document ID: {getattr(doc, 'id', 'N/A')}")
-                        logger.info(f"Document MIME: {getattr(doc, 'mime_type', 'N/A')}")
-                        
-                    if not has_media:
-                        logger.info("NO MEDIA DETECTED in this message")
+                # Dump the first 10 messages in detail when debugging
+                if message_count <= 10 and logger.isEnabledFor(logging.DEBUG):
+                    debug_message(message, message_count)
                 
                 try:
-                    message_data = {
-                        'id': message.id,
-                        'date': message.date.isoformat() if message.date else None,
-                        'message': message.message,
-                        'views': getattr(message, 'views', None),
-                        'forwards': getattr(message, 'forwards', None),
-                        'media': None
-                    }
-                    yield message_data
+                    # The date stays a datetime; orjson serializes it when written
+                    yield MessageRow(*_get_message_fields(message))
                 except Exception as e:
                     logger.error(f"Error processing message {getattr(message, 'id', 'unknown')}: {str(e)}")
                     continue
         except Exception as e:
             logger.error(f"Error fetching messages from {channel_username}: {str(e)}")
             raise
-    
-    async def download_media(self, message: Any, channel_name: str) -> Optional[Dict[str, Any]]:
-        """Download media from a message."""
-        file_path = None
-        try:
-            logger.info(f"Starting media download for message ID: {getattr(message, 'id', 'unknown')}")
-            
-            # Check for different media locations
-            media = None
-            media_type = 'unknown'
-            file_ext = ''
-            
-            # 1. Check message.media first
-            if hasattr(message, 'media') and message.media:
-                logger.info("Found media in message.media")
-                media = message.media
-                
-                if hasattr(media, 'document'):
-                    doc = media.document
-                    mime_type = getattr(doc, 'mime_type', '').lower()
-                    logger.info(f"Document MIME type: {mime_type}")
-                    
-                    if 'image/' in mime_type:
-                        media_type = 'image'
-                        file_ext = '.' + mime_type.split('/')[-1].split(';')[0]  # Handle cases like 'image/jpeg;'
-                    elif 'video/' in mime_type:
-                        media_type = 'video'
-                        file_ext = '.' + mime_type.split('/')[-1].split(';')[0]
-                    elif 'pdf' in mime_type:
-                        media_type = 'document'
-                        file_ext = '.pdf'
-                    else:
-                        # Try to get extension from document attributes
-                        media_type = 'file'
-                        file_ext = '.bin'
-                        if hasattr(doc, 'attributes'):
-                            for attr in doc.attributes:
-                                if hasattr(attr, 'file_name') and attr.file_name:
-                                    file_ext = os.path.splitext(attr.file_name)[1]
-                                    break
-                
-                elif hasattr(media, 'photo'):
-                    media_type = 'photo'
-                    file_ext = '.jpg'
-                    logger.info("Found photo in message.media")
-            
-            # 2. Check for direct document/photo attributes
-            elif hasattr(message, 'document') and message.document:
-                logger.info("Found document directly in message")
-                media = message.document
-                media_type = 'document'
-                file_ext = '.bin'  # Default extension
-                if hasattr(media, 'mime_type') and media.mime_type:
-                    mime_type = media.mime_type.lower()
-                    if 'pdf' in mime_type:
-                        file_ext = '.pdf'
-                    elif 'word' in mime_type:
-                        file_ext = '.docx'
-            
-            elif hasattr(message, 'photo') and message.photo:
-                logger.info("Found photo directly in message")
-                media = message.photo
-                media_type = 'photo'
-                file_ext = '.jpg'
-            
-            if not media:
-                logger.info("No downloadable media found in message")
-                return None
-            
-            # Create media directory
-            media_dir = os.path.join(self.base_dir, 'media', channel_name)
-            os.makedirs(media_dir, exist_ok=True)
-            logger.info(f"Saving media to directory: {media_dir}")
-            
-            # Create unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{media_type}_{timestamp}_{getattr(message, 'id', 'unknown')}{file_ext}"
-            file_path = os.path.join(media_dir, filename)
-            
-            logger.info(f"Downloading media to: {file_path}")
-            
-            # Download the file
-            try:
-                if hasattr(media, 'download'):
-                    await media.download(file=file_path)
-                else:
-                    await self.client.download_media(message, file=file_path)
-                
-                if not os.path.exists(file_path):
-                    logger.error(f"Download failed: {file_path} does not exist after download")
-                    return None
-                    
-                file_size = os.path.getsize(file_path)
-                logger.info(f"Successfully downloaded {media_type} ({file_size} bytes) to {file_path}")
-                
-                return {
-                    'type': media_type,
-                    'path': str(file_path),
-                    'url': f"/media/{channel_name}/{filename}",
-                    'filename': filename,
-                    'size': file_size,
-                    'mime_type': getattr(media, 'mime_type', '')
-                }
-                
-            except Exception as download_error:
-                logger.error(f"Error during download: {str(download_error)}")
-                # Try to clean up partially downloaded file
-                if file_path and os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        logger.error(f"Error cleaning up file {file_path}: {str(e)}")
-                return None
-            
-        except Exception as e:
-            logger.error(f"Error in download_media: {str(e)}", exc_info=True)
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception as cleanup_error:
-                    logger.error(f"Error during cleanup: {str(cleanup_error)}")
-            return None
@@ -1,5 +1,8 @@
 import os
-import psycopg2
+from itertools import groupby, islice
+from operator import itemgetter
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from telethon.sync import TelegramClient
 from telethon.tl.types import PeerChannel
 from config.config import config
@@ -8,51 +11,89 @@ from config.config import config
 api_id = config.get_telegram_config()['api_id']
 api_hash = config.get_telegram_config()['api_hash']
 
-# DB CONNECTION
-conn = psycopg2.connect(
+# Telethon fetches up to 100 messages per request
+FETCH_BATCH_SIZE = 100
+
+
+def update_message_text(pool):
+    """
+    Fill in message_text for fct_messages rows that lack it, on a pooled
+    connection so callers running this repeatedly reuse their connections.
+    """
+    conn = pool.getconn()
+    try:
+        with conn.cursor(name='backfill_cur') as rows, conn.cursor() as cursor:
+            # 1. Stream the message_ids and channels to update from a server-side
+            # cursor, grouped by channel, so only itersize rows are held at a time.
+            # dim_channels maps each channel_id hash back to its username.
+            rows.itersize = 1000
+            rows.execute("""
+                SELECT m.message_id, m.channel_id, c.channel_username
+                FROM telegram_schema.fct_messages m
+                JOIN telegram_schema.dim_channels c USING (channel_id)
+                WHERE m.message_text IS NULL
+                ORDER BY m.channel_id
+            """)
+
+            with TelegramClient('session', api_id, api_hash) as client:
+                for (channel_id, username), channel_rows in groupby(rows, key=itemgetter(1, 2)):
+                    message_ids = map(itemgetter(0), channel_rows)
+                    while chunk := list(islice(message_ids, FETCH_BATCH_SIZE)):
+                        try:
+                            # One request for the whole chunk; results line up with ids
+                            messages = client.get_messages(username, ids=[int(m) for m in chunk])
+
+                            values = [
+                                (message.text, message_id, channel_id)
+                                for message_id, message in zip(chunk, messages)
+                                if message and message.text
+                            ]
+                            execute_values(cursor, """
+                                UPDATE telegram_schema.fct_messages AS f
+                                SET message_text = v.message_text
+                                FROM (VALUES %s) AS v(message_text, message_id, channel_id)
+                                WHERE f.message_id = v.message_id AND f.channel_id = v.channel_id
+                            """, values, page_size=500)
+                            print(f"Updated {len(values)} of {len(chunk)} messages from {username}")
+                        except Exception as e:
+                            print(f"Failed for messages {chunk[0]}..{chunk[-1]} of {username}: {e}")
+
+            # Index the backfilled text so searches don't scan the table: full-text
+            # for word queries, trigrams for ILIKE '%...%' substring queries
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS fct_messages_text_fts
+                ON telegram_schema.fct_messages USING gin (to_tsvector('english', message_text))
+                WHERE message_text IS NOT NULL
+            """)
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS fct_messages_text_trgm
+                ON telegram_schema.fct_messages USING gin (message_text gin_trgm_ops)
+                WHERE message_text IS NOT NULL
+            """)
+
+        # Commit updates
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+if __name__ == "__main__":
+    # DB CONNECTION POOL
+    pool = ThreadedConnectionPool(
+        1,
+        8,
         dbname=os.getenv("POSTGRES_DB"),
         user=os.getenv("POSTGRES_USER"),
         password=os.getenv("POSTGRES_PASSWORD"),
         host=os.getenv("POSTGRES_HOST"),
         port=os.getenv("POSTGRES_PORT")
     )
-cursor = conn.cursor()
-
-# 1. Get message_ids and channel_ids to update
-cursor.execute("""
-    SELECT message_id, channel_id
-    FROM telegram_schema.fct_messages
-    WHERE message_text IS NULL
-""")
-rows = cursor.fetchall()
-
-channel_map = {
-    '9c8e1e57054ce9826cb986f55b25016d': 'lobelia4cosmetics',
-    '13d619c52e5db90ef6a786b69ba3c978': 'CheMed123',
-    'f6e7cc642365e9c68c2066ff71d8de76': 'tikvahpharma'
-}
-
-with TelegramClient('session', api_id, api_hash) as client:
-    for message_id, channel_id in rows:
-        try:
-            username = channel_map.get(channel_id)
-            if not username:
-                print(f"Channel ID {channel_id} not in map.")
-                continue
-
-            message = client.get_messages(username, ids=int(message_id))
-
-            if message and message.text:
-                cursor.execute("""
-                    UPDATE telegram_schema.fct_messages
-                    SET message_text = %s
-                    WHERE message_id = %s AND channel_id = %s
-                """, (message.text, message_id, channel_id))
-                print(f"Updated message {message_id}")
-        except Exception as e:
-            print(f"Failed for {message_id}: {e}")
-
-# Commit updates
-conn.commit()
-cursor.close()
-conn.close()
+
+    try:
+        update_message_text(pool)
+    finally:
+        pool.closeall()
@@ -1,5 +1,9 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+from collections import Counter
 from pathlib import Path
 from typing import Optional
 
@@ -7,6 +11,9 @@ def setup_logger(name: str, log_level: int = logging.INFO) -> logging.Logger:
     """
     Set up a logger with both file and console handlers.
     
+    Records are put on a queue and written by a background listener thread,
+    so logging never blocks the caller (e.g. the scraper's event loop) on I/O.
+    
     Args:
         name: Name of the logger
         log_level: Logging level (default: logging.INFO)
@@ -44,11 +51,41 @@ def setup_logger(name: str, log_level: int = logging.INFO) -> logging.Logger:
     console_handler.setLevel(log_level)
     console_handler.setFormatter(console_formatter)
     
-    # Add handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # The logger only enqueues records; the listener drains them to the handlers
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    logger.listener = listener
+    # Write out anything still queued when the process exits
+    atexit.register(listener.stop)
     
     return logger
 
+def log_error_sampled(logger: logging.Logger, counts: Counter, message: str, error: BaseException) -> None:
+    """
+    Log an error from a per-item loop, with its traceback only for the first
+    few errors of each type (and every 1000th after that).
+    
+    Formatting tracebacks is expensive, and an error storm (e.g. a Telegram
+    hiccup hitting every message) would otherwise flood the log with copies
+    of the same one.
+    
+    Args:
+        logger: Logger to write to
+        counts: Errors seen so far by exception type name; updated in place
+        message: Message to log
+        error: The exception being handled
+    """
+    key = type(error).__name__
+    counts[key] += 1
+    count = counts[key]
+    if count <= 3 or count % 1000 == 0:
+        logger.error(message, exc_info=error)
+    else:
+        logger.warning("%s (%s #%d, traceback suppressed)", message, key, count)
+
 # Create a default logger instance
 default_logger = setup_logger(__name__)
@@ -1,42 +1,169 @@
-from sqlalchemy.orm import Session
+import base64
+import functools
+import logging
+import orjson
+from datetime import date
+from typing import Optional
+from cachetools import TTLCache
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from database import redis
 
-def get_channel_activity(db: Session, channel_id: str):
-    query = text("""
+logger = logging.getLogger(__name__)
+
+# Both queries build their JSON result in Postgres, which the engine's
+# json_deserializer decodes straight into dicts; search rows stay JSON text
+
+# Recent results, keyed without the session. Activity only changes when new
+# messages are loaded; searches repeat briefly while a user types and pages.
+# Each worker keeps its own copy briefly in front of the shared Redis cache.
+_activity_cache = TTLCache(maxsize=512, ttl=60)
+_search_cache = TTLCache(maxsize=512, ttl=30)
+ACTIVITY_REDIS_TTL = 3600
+SEARCH_REDIS_TTL = 60
+
+def cached(cache, key, redis_ttl):
+    """
+    cachetools.cached for coroutine functions: caches the awaited result,
+    not the coroutine. Everything runs on the event loop, so no lock.
+    Misses fall through to Redis, when configured, before the database.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            try:
+                return cache[k]
+            except KeyError:
+                pass
+            redis_key = f"{func.__name__}:{k}"
+            value = None
+            if redis is not None:
+                try:
+                    hit = await redis.get(redis_key)
+                    value = orjson.loads(hit) if hit is not None else None
+                except RedisError as e:
+                    logger.warning("Redis cache read failed for %s: %s", redis_key, e)
+            if value is None:
+                value = await func(*args, **kwargs)
+                if redis is not None:
+                    try:
+                        await redis.set(redis_key, orjson.dumps(value), ex=redis_ttl)
+                    except RedisError as e:
+                        logger.warning("Redis cache write failed for %s: %s", redis_key, e)
+            cache[k] = value
+            return value
+        return wrapper
+    return decorator
+
+# Statements are built once at import; requests only bind parameters
+ACTIVITY_QUERY = text("""
+    SELECT coalesce(
+        json_agg(json_build_object('date', date, 'message_count', message_count) ORDER BY date),
+        '[]'::json
+    )
+    FROM (
         SELECT DATE(media_date) AS date, COUNT(*) AS message_count
         FROM telegram_schema.fct_messages
         WHERE channel_id = :channel
         GROUP BY DATE(media_date)
         ORDER BY DATE(media_date)
         limit 10
+    ) activity
+""")
+
+@cached(_activity_cache, key=lambda db, channel_id: channel_id, redis_ttl=ACTIVITY_REDIS_TTL)
+async def get_channel_activity(db: AsyncSession, channel_id: str):
+    return (await db.execute(ACTIVITY_QUERY, {"channel": channel_id})).scalar()
+
+# Search pages are addressed by the (media_date, message_id, channel_id) of
+# the last row seen, handed to clients as an opaque url-safe token. Message
+# ids are only unique per channel, so all three are needed to order rows.
+def encode_cursor(media_date: str, message_id: int, channel_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{media_date}:{message_id}:{channel_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[date, int, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        media_date, message_id, channel_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 2)
+        # Undated rows sort as '-infinity', which asyncpg binds from date.min
+        sort_date = date.min if media_date == "-infinity" else date.fromisoformat(media_date)
+        return sort_date, int(message_id), channel_id
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+# Words are matched through the GIN index on to_tsvector('english', ...), which
+# stems and case-folds them. A query ending in '*' is matched as a substring
+# anywhere in the text instead, through the trigram index with ILIKE.
+FTS_MATCH = "to_tsvector('english', message_text) @@ plainto_tsquery('english', :query)"
+SUBSTRING_MATCH = "message_text ILIKE :query"
+# Newest first; messages without a date sort last. Matches the
+# fct_messages post_hook index.
+SORT_DATE = "coalesce(media_date, '-infinity'::date)"
+# Seek past the previous page instead of OFFSET, so deep pages are an
+# index range scan rather than a scan that discards every earlier row
+SEEK = f"AND ({SORT_DATE}, message_id, channel_id) < (:after_date, :after_id, :after_channel)"
+
+def _search_query(match: str, seek: str):
+    # count(*) OVER () is computed before LIMIT, so every row of the page
+    # carries the number of matches remaining from the cursor on. The rows
+    # come back as JSON text, which is spliced into the response unparsed;
+    # only the count and the last row's key are decoded.
+    return text(f"""
+        SELECT
+            json_build_object(
+                'count', coalesce(max(total), 0),
+                'rows', count(*),
+                'last', (array_agg(json_build_array(sort_date, message_id, channel_id)
+                                   ORDER BY sort_date, message_id, channel_id))[1]
+            ),
+            coalesce(json_agg(json_build_object(
+                'message_id', message_id,
+                'channel_id', channel_id,
+                'message_text', message_text,
+                'media_date', media_date,
+                'has_image', has_image
+            ) ORDER BY sort_date DESC, message_id DESC, channel_id DESC), '[]'::json)::text
+        FROM (
+            SELECT
+                message_id,
+                channel_id,
+                message_text,
+                media_date,
+                has_image,
+                {SORT_DATE} AS sort_date,
+                count(*) OVER () AS total
+            FROM telegram_schema.fct_messages
+            WHERE message_text IS NOT NULL
+            AND {match}
+            {seek}
+            ORDER BY sort_date DESC, message_id DESC, channel_id DESC
+            LIMIT :limit
+        ) matches
     """)
-    result = db.execute(query, {"channel": channel_id})
-    return [{"date": row.date, "message_count": row.message_count} for row in result]
-
-def get_messages(db: Session, query: str):
-    print(f"Searching for query: {query}")
-    sql = """
-        SELECT 
-            message_id,
-            channel_id,
-            message_text,
-            media_date,
-            has_image
-        FROM telegram_schema.fct_messages
-        WHERE message_text IS NOT NULL
-        AND message_text ILIKE :query
-        ORDER BY media_date DESC
-        LIMIT 50
+
+# Keyed by (substring query, has cursor)
+SEARCH_QUERIES = {
+    (substring, seek): _search_query(SUBSTRING_MATCH if substring else FTS_MATCH, SEEK if seek else "")
+    for substring in (False, True)
+    for seek in (False, True)
+}
+
+@cached(_search_cache, key=lambda db, query, limit, after: (query, limit, after), redis_ttl=SEARCH_REDIS_TTL)
+async def get_messages(db: AsyncSession, query: str, limit: int, after: Optional[tuple[date, int, str]] = None):
+    """
+    Return one page of messages matching query, newest first, as
+    {"count": matches from this page on, "rows": rows in the page,
+    "last": [media_date, message_id, channel_id] of its last row,
+    "results": JSON array text}. after is the decoded cursor of the
+    previous page's last row.
     """
-    print(f"Executing SQL: {sql}")
-    result = db.execute(text(sql), {"query": f"%{query}%"})
-    rows = list(result)
-    print(f"Found {len(rows)} matching messages")
-    
-    return [{
-        "message_id": row.message_id, 
-        "channel_id": row.channel_id, 
-        "message_text": row.message_text,
-        "media_date": row.media_date,
-        "has_image": row.has_image
-    } for row in rows]
+    substring = query.endswith("*")
+    params = {"query": f"%{query.rstrip('*')}%" if substring else query, "limit": limit}
+    if after is not None:
+        params["after_date"], params["after_id"], params["after_channel"] = after
+    sql = SEARCH_QUERIES[substring, after is not None]
+    logger.debug("Executing SQL: %s", sql)
+    page, results = (await db.execute(sql, params)).one()
+    return {**page, "results": results}
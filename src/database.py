@@ -1,21 +1,49 @@
 import os
-from sqlalchemy import create_engine
+from asyncio import current_task
+import orjson
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_scoped_session, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
 load_dotenv()  # Load env vars from .env
 
 # Construct the database URL with host
-DATABASE_URL = f"postgresql+psycopg2://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST', 'localhost')}:{os.getenv('POSTGRES_PORT', '5432')}/{os.getenv('POSTGRES_DB')}"
+DATABASE_URL = f"postgresql+asyncpg://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST', 'localhost')}:{os.getenv('POSTGRES_PORT', '5432')}/{os.getenv('POSTGRES_DB')}"
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Pool sizing per API worker. DB_POOL_SIZE=0 opens a connection per session
+# instead, for deployments where an external pooler (pgbouncer) owns them.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+
+if DB_POOL_SIZE > 0:
+    pool_options = dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+else:
+    pool_options = dict(poolclass=NullPool)
+
+# asyncpg hands json columns back as text; the dialect decodes them with this
+engine = create_async_engine(DATABASE_URL, json_deserializer=orjson.loads, **pool_options)
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+# One session per request task; anything in the request that asks for a
+# session gets the same one, and remove() always returns its connection
+ScopedSession = async_scoped_session(AsyncSessionLocal, scopefunc=current_task)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Shared response cache for all API workers; unset REDIS_URL to run without it
+REDIS_URL = os.getenv('REDIS_URL')
+redis = Redis.from_url(REDIS_URL) if REDIS_URL else None
+
+async def get_db():
     try:
-        yield db
+        yield ScopedSession()
     finally:
-        db.close()
+        await ScopedSession.remove()
@@ -1,12 +1,23 @@
+import logging
+import orjson
+from types import MappingProxyType
+from typing import Literal, Optional, get_args
 from fastapi import FastAPI
-from fastapi import Depends
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, Response
+from fastapi import Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from schemas import ChannelActivity, MessageSearchResult
-from crud import get_channel_activity, get_messages
+from crud import get_channel_activity, get_messages, encode_cursor, decode_cursor
 from database import get_db
 from fastapi import HTTPException
 
-app = FastAPI()
+# Endpoints return the JSON Postgres built as-is; the schemas only document
+# them (responses=...) rather than revalidating every row (response_model=...)
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Per-request traces are DEBUG, so at the default level they cost an int
+# compare rather than string formatting and a blocking stdout write
+logger = logging.getLogger(__name__)
 
 @app.get("/")
 def read_root():
@@ -17,50 +28,71 @@ def read_top_products(limit: int = 10):
 
     return {"top_products": "top_products", "limit": limit}
 
-channel_map = {
+# Read-only: channel_ids are the dim_channels hashes of each username
+channel_map = MappingProxyType({
     'lobelia4cosmetics': '9c8e1e57054ce9826cb986f55b25016d',
     'CheMed123': '13d619c52e5db90ef6a786b69ba3c978',
     'tikvahpharma': 'f6e7cc642365e9c68c2066ff71d8de76'
-}
+})
+# Unknown channel names are rejected with a 422 during request validation,
+# and show up as an enum in the OpenAPI schema
+ChannelName = Literal['lobelia4cosmetics', 'CheMed123', 'tikvahpharma']
+assert set(get_args(ChannelName)) == channel_map.keys()
+
+@app.get("/api/channels/{channel_name}/activity", responses={200: {"model": list[ChannelActivity]}})
+async def get_activity(channel_name: ChannelName, db: AsyncSession = Depends(get_db)):
+    return await get_channel_activity(db, channel_map[channel_name])
 
-@app.get("/api/channels/{channel_name}/activity", response_model=list[ChannelActivity])
-def get_activity(channel_name: str, db: Session = Depends(get_db)):
-    channel_id = channel_map.get(channel_name)
-    if not channel_id:
-        raise HTTPException(status_code=404, detail="Channel not found")
-    return get_channel_activity(db, channel_id)
+# Shorter search terms would match (nearly) every message, so they are
+# answered with an empty page without touching the database
+MIN_QUERY_LENGTH = 2
     
-@app.get("/api/search/messages", response_model=MessageSearchResult)
+@app.get("/api/search/messages", responses={200: {"model": MessageSearchResult}})
 async def search_messages(
     query: str,
-    limit: int = 50,
-    offset: int = 0,
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=100),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Search for messages containing the given query string.
     
-    - **query**: Search term to look for in message texts
-    - **limit**: Maximum number of results to return (default: 50, max: 100)
-    - **offset**: Number of results to skip for pagination (default: 0)
+    - **query**: Words to look for in message texts; end it with * to match it as a substring anywhere in the text instead
+    - **limit**: Maximum number of results to return, 1 to 100 (default: 50)
+    - **after**: next_cursor from the previous page; omit for the first page
     """
-    print(f"API Request - Search query: '{query}', limit: {limit}, offset: {offset}")
-    
-    # Validate limit
-    limit = min(max(1, limit), 100)  # Ensure limit is between 1 and 100
+    logger.debug("Search query: %r, limit: %s, after: %s", query, limit, after)
+
+    term = query.strip()
+    if len(term.rstrip("*").strip()) < MIN_QUERY_LENGTH:
+        return {"success": True, "count": 0, "results": [], "query": query, "next_cursor": None}
+
+    try:
+        seek = decode_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        results = get_messages(db, query)
-        print(f"API Response - Found {len(results)} results")
-        
-        return {
-            "success": True,
-            "count": len(results),
-            "results": results[offset:offset + limit],
-            "query": query
-        }
+        # Postgres pages the results and counts the matches in the same query
+        page = await get_messages(db, term, limit, seek)
+        logger.debug("Found %s results for %r", page["count"], query)
+
+        # A short page is the last one
+        next_cursor = None
+        if page["rows"] == limit:
+            next_cursor = encode_cursor(*page["last"])
+
+        # The results are already JSON from Postgres; wrap them without
+        # building and re-encoding a dict per row
+        body = b'{"success":true,"count":%d,"results":%b,"query":%b,"next_cursor":%b}' % (
+            page["count"],
+            page["results"].encode(),
+            orjson.dumps(query),
+            orjson.dumps(next_cursor),
+        )
+        return Response(body, media_type="application/json")
         
     except Exception as e:
         error_msg = f"Error searching messages: {str(e)}"
-        print(error_msg)
+        logger.exception(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
\ No newline at end of file
@@ -18,3 +18,4 @@ class MessageSearchResult(BaseModel):
     count: int
     results: list[MessageBase]
     query: str
+    next_cursor: Optional[str] = None
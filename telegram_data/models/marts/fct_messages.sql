@@ -1,5 +1,11 @@
 -- models/marts/fct_messages.sql
-{{ config(materialized='table') }}
+{{ config(
+    materialized='table',
+    post_hook=[
+      "CREATE INDEX ON {{ this }} (channel_id, (DATE(media_date)))",
+      "CREATE INDEX ON {{ this }} ((coalesce(media_date, '-infinity'::date)), message_id, channel_id)"
+    ]
+) }}
 
 SELECT
   m.message_id,
@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# The scripts and the API import their siblings as top-level modules
+for path in (ROOT / "scripts", ROOT / "src"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# config validates the Telegram credentials on import; tests never connect
+for var in ("TELEGRAM_APP_ID", "TELEGRAM_API_HASH", "TELEGRAM_PHONE"):
+    os.environ.setdefault(var, "0")
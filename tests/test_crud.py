@@ -0,0 +1,33 @@
+import base64
+from datetime import date
+
+import pytest
+
+from crud import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize('media_date, expected', [
+    ('2024-03-01', date(2024, 3, 1)),
+    # Undated messages sort as -infinity, which asyncpg binds from date.min
+    ('-infinity', date.min),
+])
+def test_cursor_round_trip(media_date, expected):
+    cursor = encode_cursor(media_date, 42, '9c8e1e57054ce9826cb986f55b25016d')
+    assert decode_cursor(cursor) == (expected, 42, '9c8e1e57054ce9826cb986f55b25016d')
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor('2024-03-01', 2 ** 40, '>>>???')
+    assert set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=')
+
+
+@pytest.mark.parametrize('cursor', [
+    '!!!',
+    base64.urlsafe_b64encode(b'2024-03-01:abc:channel').decode(),
+    base64.urlsafe_b64encode(b'2024-13-01:1:channel').decode(),
+    base64.urlsafe_b64encode(b'2024-03-01:1').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
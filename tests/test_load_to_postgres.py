@@ -0,0 +1,20 @@
+import pytest
+
+from load_to_postgres import get_channel_name_from_path
+
+
+@pytest.mark.parametrize('path, channel', [
+    ('data/raw/telegram_messages/2024-03-01/CheMed123/messages_20240301_120000.jsonl.zst', 'CheMed123'),
+    ('/abs/data/raw/telegram_messages/2024-03-01/tikvahpharma/media_info_20240301_120000.jsonl', 'tikvahpharma'),
+    ('backup/2024-03-01/lobelia4cosmetics/messages.json', 'lobelia4cosmetics'),
+])
+def test_get_channel_name_from_path(path, channel):
+    assert get_channel_name_from_path(path) == channel
+
+
+@pytest.mark.parametrize('path', [
+    'data/raw/telegram_messages/2024-03-01/messages.jsonl',
+    'messages.jsonl',
+])
+def test_get_channel_name_from_path_without_channel(path):
+    assert get_channel_name_from_path(path) == 'unknown'
@@ -0,0 +1,108 @@
+import asyncio
+import io
+import json
+import os
+
+import pytest
+import zstandard as zstd
+
+from scraping import NDJSONWriter
+
+
+class Crash(Exception):
+    pass
+
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        if path.endswith('.zst'):
+            f = io.BufferedReader(zstd.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def write_then_crash(path, checkpoint_file, before, after):
+    """Write before, checkpoint, write after (flushed, not checkpointed), then crash."""
+    with pytest.raises(Crash):
+        async with NDJSONWriter(path, atomic=True) as writer:
+            for obj in before:
+                await writer.write(obj)
+            await writer.checkpoint(checkpoint_file, count=len(before))
+            for obj in after:
+                await writer.write(obj)
+            await writer.flush()
+            raise Crash()
+    with open(checkpoint_file, encoding='utf-8') as f:
+        return json.load(f)
+
+
+async def resume(path, offset, objs):
+    async with NDJSONWriter(path, offset=offset, atomic=True) as writer:
+        for obj in objs:
+            await writer.write(obj)
+
+
+@pytest.mark.parametrize('name', ['messages.jsonl', 'messages.jsonl.zst'])
+def test_resume_drops_data_after_checkpoint(tmp_path, name):
+    path = str(tmp_path / name)
+    checkpoint_file = str(tmp_path / 'messages.ckpt')
+    before = [{'id': i} for i in range(5, 2, -1)]
+
+    state = asyncio.run(write_then_crash(path, checkpoint_file, before, [{'id': 2}, {'id': 1}]))
+
+    # The interrupted file stays under its temporary name
+    assert state['count'] == 3
+    assert not os.path.exists(path)
+    assert os.path.exists(path + '.tmp')
+
+    asyncio.run(resume(path, state['offset'], [{'id': 2}, {'id': 1}, {'id': 0}]))
+
+    assert read_lines(path) == before + [{'id': 2}, {'id': 1}, {'id': 0}]
+    assert not os.path.exists(path + '.tmp')
+
+
+@pytest.mark.parametrize('name', ['messages.jsonl', 'messages.jsonl.zst'])
+def test_resume_after_rename(tmp_path, name):
+    # A run can stop after renaming the file but before clearing its checkpoint
+    path = str(tmp_path / name)
+    checkpoint_file = str(tmp_path / 'messages.ckpt')
+
+    async def write_complete():
+        async with NDJSONWriter(path, atomic=True) as writer:
+            await writer.write({'id': 2})
+            await writer.checkpoint(checkpoint_file, count=1)
+            await writer.write({'id': 1})
+
+    asyncio.run(write_complete())
+    with open(checkpoint_file, encoding='utf-8') as f:
+        state = json.load(f)
+
+    asyncio.run(resume(path, state['offset'], [{'id': 1}]))
+
+    assert read_lines(path) == [{'id': 2}, {'id': 1}]
+
+
+def test_checkpoint_offsets_are_zstd_frame_boundaries(tmp_path):
+    path = str(tmp_path / 'messages.jsonl.zst')
+    checkpoint_file = str(tmp_path / 'messages.ckpt')
+    state = asyncio.run(write_then_crash(path, checkpoint_file, [{'id': 1}], [{'id': 0}]))
+
+    # The prefix up to the checkpoint decompresses on its own
+    with open(path + '.tmp', 'rb') as f:
+        prefix = f.read(state['offset'])
+    assert zstd.ZstdDecompressor().decompressobj().decompress(prefix) == b'{"id":1}\n'
+
+
+def test_non_atomic_writer_writes_in_place(tmp_path):
+    path = str(tmp_path / 'media_info.jsonl')
+
+    async def write_and_crash():
+        with pytest.raises(Crash):
+            async with NDJSONWriter(path) as writer:
+                await writer.write({'id': 1})
+                raise Crash()
+
+    asyncio.run(write_and_crash())
+
+    # Whatever was flushed before the crash is already under the final name
+    assert read_lines(path) == [{'id': 1}]
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,16 @@
+import pytest
+
+from services.telegram_service import document_kind
+
+
+@pytest.mark.parametrize('mime_type, kind', [
+    ('image/jpeg', 'image'),
+    ('IMAGE/PNG', 'image'),
+    ('video/mp4; codecs="avc1"', 'video'),
+    ('application/pdf', None),
+    ('application/msword', None),
+    ('', None),
+    (None, None),
+])
+def test_document_kind(mime_type, kind):
+    assert document_kind(mime_type) == kind